@@ -1,17 +1,50 @@
+import io
 import os
-import torch
-import torch.nn.functional as F
-from PIL import Image
-import torchvision.transforms as transforms
-import torchvision.models as torchvision_models  # Renamed to avoid conflict
+import copy
+import importlib
+from PIL import Image, ImageOps
 from collections import Counter
 import json
 import warnings
 import argparse
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List
 import numpy as np
+try:
+    import fcntl
+except ImportError:  # not on Windows; weight store exports are then not serialized
+    fcntl = None
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
+class _LazyModule:
+    """Placeholder for a heavy module: imported on first attribute access, then bound in its place"""
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+            globals()[self._alias] = self._module  # later lookups in this file see the real module
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+# CHANGE: torch / torchvision (~4s) are imported on first use instead of on `import app`, so the
+# CLI client, the server's /health and tools that never run a model start without them
+torch = _LazyModule("torch", "torch")
+F = _LazyModule("torch.nn.functional", "F")
+transforms = _LazyModule("torchvision.transforms", "transforms")
+torchvision_models = _LazyModule("torchvision.models", "torchvision_models")  # Renamed to avoid conflict
+
 # Define class names and info
 CLASS_NAMES = {
     0: 'akiec',  # Actinic Keratoses and Intraepithelial Carcinoma
@@ -68,143 +101,443 @@ CLASS_INFO = {
     }
 }
 
-def load_models(models_dir="./models"):
-    """Load all models from the models directory"""
-    loaded_models = {}  # Renamed from 'models' to avoid conflict with the imported module
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}")
-    
-    # Check if models directory exists
+# the High-risk classes, plus scc, which other lesion models emit (server.py risk, cascade escalation)
+MALIGNANT_CLASSES = {name for name, info in CLASS_INFO.items() if info['risk'] == 'High'} | {'scc'}
+
+def build_model(model_name):
+    """Build an (untrained) backbone with a 7-class head for the given model name"""
+    if 'resnet' in model_name:
+        model = torchvision_models.resnet50(pretrained=False)
+        model.fc = torch.nn.Linear(model.fc.in_features, 7)
+    elif 'densenet' in model_name:
+        model = torchvision_models.densenet121(pretrained=False)
+        model.classifier = torch.nn.Linear(model.classifier.in_features, 7)
+    elif 'mobilenet' in model_name:
+        model = torchvision_models.mobilenet_v3_large(pretrained=False)
+        model.classifier[3] = torch.nn.Linear(model.classifier[3].in_features, 7)
+    else:
+        raise ValueError(f"Unknown model architecture: {model_name}")
+    return model
+
+# Possible model filenames (with variations)
+MODEL_FILENAMES = {
+    "mobilenetv3": ["final_mobilenetv3_model.pt", "mobilenetv3.pt", "final_mobilenetv3.pt"],
+    "densenet121": ["final_densenet121_model.pt", "densenet121.pt", "final_densenet121.pt"],
+    "resnet50": ["final_resnet50_model.pt", "resnet50.pt", "final_resnet50.pt"]
+}
+
+# The model / image search never descends into these (the Next.js app's node_modules alone is
+# tens of thousands of directories), nor into hidden ones like .git or the weight-store caches
+_SEARCH_SKIP_DIRS = {"node_modules", "__pycache__", "venv", "env"}
+
+def _walk_project(root):
+    """os.walk over root, pruning hidden, dependency and cache directories"""
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d not in _SEARCH_SKIP_DIRS]
+        yield dirpath, dirs, files
+
+def resolve_models_dir(models_dir):
+    """Return models_dir, or a 'models' directory found under the project if it does not exist"""
     if not os.path.exists(models_dir):
         print(f"Models directory {models_dir} not found. Searching for models...")
         # Try to find models in parent directories
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        for root, dirs, files in os.walk(os.path.dirname(script_dir)):
+        for root, dirs, files in _walk_project(os.path.dirname(script_dir)):
             if "models" in dirs:
                 models_dir = os.path.join(root, "models")
                 print(f"Found models directory at: {models_dir}")
                 break
-    
-    # Possible model filenames (with variations)
-    possible_models = {
-        "mobilenetv3": ["final_mobilenetv3_model.pt", "mobilenetv3.pt", "final_mobilenetv3.pt"],
-        "densenet121": ["final_densenet121_model.pt", "densenet121.pt", "final_densenet121.pt"],
-        "resnet50": ["final_resnet50_model.pt", "resnet50.pt", "final_resnet50.pt"]
-    }
-    
-    # Find and load each model
-    for model_name, filenames in possible_models.items():
-        model_found = False
+    return models_dir
+
+def find_model_files(models_dir):
+    """Map each backbone name to the first existing weight file in models_dir"""
+    found = {}
+    for model_name, filenames in MODEL_FILENAMES.items():
         for filename in filenames:
             model_path = os.path.join(models_dir, filename)
             if os.path.exists(model_path):
-                print(f"Loading {model_name} model from {model_path}")
+                found[model_name] = model_path
+                break
+    return found
+
+def _load_state(model, model_data):
+    """Copy weights from any of the supported checkpoint formats into model"""
+    # Handle different saved formats
+    if isinstance(model_data, dict) and 'model' in model_data:
+        # If the file contains a dict with 'model' key
+        model.load_state_dict(model_data['model'])
+    elif isinstance(model_data, dict) and 'state_dict' in model_data:
+        # If the file contains a state_dict
+        model.load_state_dict(model_data['state_dict'])
+    elif isinstance(model_data, dict) and len(model_data) > 0:
+        # If the file contains just a state dict (OrderedDict)
+        # Clean state_dict if needed (remove module. prefix)
+        cleaned_state_dict = {k.replace('module.', ''): v for k, v in model_data.items()}
+        model.load_state_dict(cleaned_state_dict, strict=False)
+    elif hasattr(model_data, 'state_dict'):
+        # If the file contains the model object directly
+        model.load_state_dict(model_data.state_dict())
+
+def _compiled_cache_path(cache_dir, model_name, model_path):
+    """Cache file for a TorchScript artifact, keyed on the source file's size and mtime"""
+    st = os.stat(model_path)
+    return os.path.join(cache_dir, f"{model_name}-{st.st_size:x}-{int(st.st_mtime):x}.ts")
+
+def _load_one(model_name, models_dir, device, cache_dir=None):
+    """Load one backbone from the first loadable candidate file; returns (model, timings) or (None, {})"""
+    for filename in MODEL_FILENAMES[model_name]:
+        model_path = os.path.join(models_dir, filename)
+        if not os.path.exists(model_path):
+            continue
+        print(f"Loading {model_name} model from {model_path}")
+        try:
+            timings = {}
+            cached = _compiled_cache_path(cache_dir, model_name, model_path) if cache_dir else None
+            model = None
+            if cached and os.path.exists(cached):
+                # TorchScript artifact: skips architecture construction and state_dict copy
+                t0 = time.perf_counter()
                 try:
-                    # Initialize the base model architecture first
-                    if 'resnet' in model_name:
-                        model = torchvision_models.resnet50(pretrained=False)
-                        model.fc = torch.nn.Linear(model.fc.in_features, 7)
-                    elif 'densenet' in model_name:
-                        model = torchvision_models.densenet121(pretrained=False)
-                        model.classifier = torch.nn.Linear(model.classifier.in_features, 7)
-                    elif 'mobilenet' in model_name:
-                        model = torchvision_models.mobilenet_v3_large(pretrained=False)
-                        model.classifier[3] = torch.nn.Linear(model.classifier[3].in_features, 7)
-                    else:
-                        raise ValueError(f"Unknown model architecture: {model_name}")
-                    
-                    # Load model to the appropriate device
-                    model_data = torch.load(model_path, map_location=device)
-                    
-                    # Handle different saved formats
-                    if isinstance(model_data, dict) and 'model' in model_data:
-                        # If the file contains a dict with 'model' key
-                        model.load_state_dict(model_data['model'])
-                    elif isinstance(model_data, dict) and 'state_dict' in model_data:
-                        # If the file contains a state_dict
-                        model.load_state_dict(model_data['state_dict'])
-                    elif isinstance(model_data, dict) and len(model_data) > 0:
-                        # If the file contains just a state dict (OrderedDict)
-                        # Clean state_dict if needed (remove module. prefix)
-                        cleaned_state_dict = {k.replace('module.', ''): v for k, v in model_data.items()}
-                        model.load_state_dict(cleaned_state_dict, strict=False)
-                    elif hasattr(model_data, 'state_dict'):
-                        # If the file contains the model object directly
-                        model.load_state_dict(model_data.state_dict())
-                    
-                    model.eval()  # Set model to evaluation mode
-                    model = model.to(device)  # Ensure model is on the correct device
-                    loaded_models[model_name] = model
-                    print(f"Successfully loaded {model_name}")
-                    model_found = True
-                    break
+                    model = torch.jit.load(cached, map_location=device)
+                    timings["cache_load"] = time.perf_counter() - t0
                 except Exception as e:
-                    print(f"Error loading {model_name} from {model_path}: {e}")
-        
-        if not model_found:
+                    # truncated or corrupt artifact: drop it and rebuild from the source weights below
+                    print(f"Discarding unreadable compiled cache {cached}: {e}")
+                    try:
+                        os.unlink(cached)
+                    except OSError:
+                        pass
+            if model is None:
+                # Initialize the base model architecture first
+                t0 = time.perf_counter()
+                model = build_model(model_name)
+                timings["construct"] = time.perf_counter() - t0
+
+                # Load model to the appropriate device
+                t0 = time.perf_counter()
+                model_data = torch.load(model_path, map_location=device)
+                timings["torch_load"] = time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                _load_state(model, model_data)
+                timings["load_state_dict"] = time.perf_counter() - t0
+
+                if cached:
+                    t0 = time.perf_counter()
+                    # temp file + rename: concurrent workers never see (or load) a half-written artifact
+                    tmp_path = cached + f".{os.getpid()}.tmp"
+                    try:
+                        os.makedirs(cache_dir, exist_ok=True)
+                        torch.jit.save(torch.jit.script(model.eval()), tmp_path)
+                        os.replace(tmp_path, cached)
+                        timings["cache_write"] = time.perf_counter() - t0
+                    except Exception as e:
+                        print(f"Could not cache compiled {model_name}: {e}")
+                        try:
+                            os.unlink(tmp_path)
+                        except OSError:
+                            pass
+
+            model.eval()  # Set model to evaluation mode
+            model = model.to(device)  # Ensure model is on the correct device
+            print(f"Successfully loaded {model_name} (" + ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in timings.items()) + ")")
+            return model, timings
+        except Exception as e:
+            print(f"Error loading {model_name} from {model_path}: {e}")
+    return None, {}
+
+def weights_version(signatures):
+    """Short digest identifying a model set from its weight-file signatures (path, size, mtime)"""
+    return hashlib.sha1(json.dumps(signatures, sort_keys=True).encode()).hexdigest()[:12]
+
+# Filled by load_models: per-backbone phase timings (seconds) of the last load
+LOAD_TIMINGS = {}
+
+def load_models(models_dir="./models", parallel=None, cache_dir=None):
+    """Load all models from the models directory"""
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+    if parallel is None:
+        parallel = os.environ.get("MODEL_LOAD_PARALLEL", "1") != "0"
+    if cache_dir is None:
+        # CHANGE: optional TorchScript cache to skip architecture re-construction
+        cache_dir = os.environ.get("MODEL_CACHE_DIR") or None
+    
+    # Check if models directory exists
+    models_dir = resolve_models_dir(models_dir)
+    
+    # Find and load each model (the three backbones load concurrently; torch releases the GIL)
+    t_start = time.perf_counter()
+    names = list(MODEL_FILENAMES)
+    if parallel:
+        with ThreadPoolExecutor(max_workers=len(names)) as ex:
+            results = list(ex.map(lambda name: _load_one(name, models_dir, device, cache_dir), names))
+    else:
+        results = [_load_one(name, models_dir, device, cache_dir) for name in names]
+
+    loaded_models = {}  # Renamed from 'models' to avoid conflict with the imported module
+    LOAD_TIMINGS.clear()
+    for model_name, (model, timings) in zip(names, results):
+        if model is None:
             print(f"Warning: Could not find or load any {model_name} model files!")
+            continue
+        loaded_models[model_name] = model
+        LOAD_TIMINGS[model_name] = timings
+    LOAD_TIMINGS["total"] = time.perf_counter() - t_start
     
     # Check if any models were loaded
     if not loaded_models:
         print("No models could be loaded! Unable to make predictions.")
         return None, device
     else:
-        print(f"Loaded {len(loaded_models)} models successfully")
+        print(f"Loaded {len(loaded_models)} models successfully in {LOAD_TIMINGS['total']:.2f}s")
         
     return loaded_models, device
 
+# ==== SHARED WEIGHT STORE ====
+# Plain CPU state_dict files that every worker process memory-maps read-only, so
+# N uvicorn workers share one copy of the weights through the page cache.
+WEIGHT_STORE_MANIFEST = "manifest.json"
+
+def _source_signature(path):
+    st = os.stat(path)
+    return {"source": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime}
+
+def export_weight_store(loaded_models, store_dir, sources=None):
+    """Write each loaded backbone's weights as a mmap-able file plus a manifest"""
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = {"models": {}}
+    for model_name, model in loaded_models.items():
+        filename = f"{model_name}.pt"
+        state = {k: v.detach().cpu().contiguous() for k, v in model.state_dict().items()}
+        tmp_path = os.path.join(store_dir, filename + f".{os.getpid()}.tmp")
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, os.path.join(store_dir, filename))
+        entry = {"file": filename}
+        if sources and model_name in sources:
+            entry.update(_source_signature(sources[model_name]))
+        manifest["models"][model_name] = entry
+    # manifest last and atomically: readers never see it ahead of the files it lists
+    manifest_tmp = os.path.join(store_dir, WEIGHT_STORE_MANIFEST + f".{os.getpid()}.tmp")
+    with open(manifest_tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_tmp, os.path.join(store_dir, WEIGHT_STORE_MANIFEST))
+    print(f"Exported {len(manifest['models'])} models to weight store {store_dir}")
+    return manifest
+
+def weight_store_is_current(store_dir, models_dir):
+    """True if the store exists and was exported from the weight files currently in models_dir"""
+    manifest_path = os.path.join(store_dir, WEIGHT_STORE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        entries = json.load(f).get("models", {})
+    sources = find_model_files(resolve_models_dir(models_dir))
+    if set(entries) != set(sources):
+        return False
+    for model_name, path in sources.items():
+        sig = _source_signature(path)
+        entry = entries[model_name]
+        if any(entry.get(k) != sig[k] for k in sig):
+            return False
+        if not os.path.exists(os.path.join(store_dir, entry["file"])):
+            return False
+    return True
+
+def ensure_weight_store(store_dir, models_dir):
+    """Export models_dir to the store unless it is current; True if it exported.
+
+    Holds a lock file while checking and exporting, so when several workers see
+    new weights at once (hot reload) one exports and the rest map its files.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, ".export.lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # released when the file closes
+        if weight_store_is_current(store_dir, models_dir):
+            return False
+        loaded_models, _ = load_models(models_dir)
+        if not loaded_models:
+            raise RuntimeError(f"Could not load any models from {models_dir} to export")
+        export_weight_store(loaded_models, store_dir, sources=find_model_files(resolve_models_dir(models_dir)))
+        return True
+
+def load_weight_store(store_dir):
+    """Memory-map the models in a weight store; read-only pages are shared between processes"""
+    device = torch.device("cpu")
+    with open(os.path.join(store_dir, WEIGHT_STORE_MANIFEST)) as f:
+        entries = json.load(f)["models"]
+
+    loaded_models = {}
+    for model_name, entry in entries.items():
+        # build on the meta device so no throwaway fp32 weights get allocated
+        with torch.device("meta"):
+            model = build_model(model_name)
+        state = torch.load(os.path.join(store_dir, entry["file"]), map_location="cpu", mmap=True, weights_only=True)
+        model.load_state_dict(state, assign=True)
+        model.eval()
+        loaded_models[model_name] = model
+    print(f"Memory-mapped {len(loaded_models)} models from weight store {store_dir}")
+    return (loaded_models or None), device
+
+# ==== REDUCED-PRECISION INFERENCE ====
+# MODEL_PRECISION="resnet50=int8,densenet121=bf16+channels_last,*=fp32"
+#   fp32  full precision (default)
+#   int8  dynamic int8 quantization (torch.ao quantize_dynamic; applies to the Linear layers)
+#   bf16  bfloat16 autocast on CPU, where the CPU supports bf16
+#   +channels_last  NHWC memory format for weights and inputs
+PRECISION_MODES = ("fp32", "int8", "bf16")
+
+def parse_precision(spec):
+    """Parse a MODEL_PRECISION spec into {model_name: (mode, channels_last)}; '*' sets the default"""
+    options = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.rpartition("=")
+        parts = value.strip().lower().split("+")
+        mode = parts[0] or "fp32"
+        if mode not in PRECISION_MODES:
+            raise ValueError(f"Unknown precision mode {mode!r} in {item!r} (expected one of {PRECISION_MODES})")
+        options[name.strip() or "*"] = (mode, "channels_last" in parts[1:])
+    default = options.pop("*", ("fp32", False))
+    return {model_name: options.get(model_name, default) for model_name in MODEL_FILENAMES}
+
+def _bf16_supported():
+    check = getattr(torch.cpu, "_is_avx512_bf16_supported", None)
+    return bool(check()) if check else True
+
+class PrecisionModel:
+    """Callable wrapper that runs a backbone with its precision / memory-format options"""
+
+    def __init__(self, module, mode="fp32", channels_last=False):
+        self.module = module
+        self.mode = mode
+        self.channels_last = channels_last
+
+    def __call__(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        if self.mode == "bf16":
+            with torch.autocast("cpu", dtype=torch.bfloat16):
+                return self.module(x).float()
+        return self.module(x)
+
+    def eval(self):
+        self.module.eval()
+        return self
+
+def apply_precision(loaded_models, spec):
+    """Return a copy of loaded_models with each backbone converted/wrapped per the precision spec (inputs are left unmodified)"""
+    if not loaded_models:
+        return loaded_models
+    options = parse_precision(spec)
+    converted = {}
+    for model_name, model in loaded_models.items():
+        mode, channels_last = options.get(model_name, ("fp32", False))
+        if mode == "bf16" and not _bf16_supported():
+            print(f"Warning: CPU has no native bf16 support; running {model_name} in fp32")
+            mode = "fp32"
+        if isinstance(model, torch.jit.ScriptModule) and (mode == "int8" or channels_last):
+            print(f"Warning: {model_name} is a TorchScript artifact; int8/channels_last not applied")
+            mode, channels_last = ("fp32" if mode == "int8" else mode), False
+        if mode == "int8" or channels_last:
+            # both convert in place; the caller's module (e.g. an fp32 baseline) must stay untouched
+            model = copy.deepcopy(model)
+        if mode == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        if mode != "fp32" or channels_last:
+            print(f"{model_name}: precision {mode}" + (" + channels_last" if channels_last else ""))
+            model = PrecisionModel(model, mode, channels_last)
+        converted[model_name] = model
+    return converted
+
+# Shared preprocessing pipeline (built once, on first use, instead of per call)
+IMAGE_MEAN = [0.485, 0.456, 0.406]
+IMAGE_STD = [0.229, 0.224, 0.225]
+_TRANSFORMS = {}
+
+def image_transforms(normalize=True):
+    """Resize + ToTensor (+ Normalize); without Normalize for the fused ensemble, which normalizes inside its graph"""
+    if normalize not in _TRANSFORMS:
+        steps = [transforms.Resize((224, 224)), transforms.ToTensor()]
+        if normalize:
+            steps.append(transforms.Normalize(mean=IMAGE_MEAN, std=IMAGE_STD))
+        _TRANSFORMS[normalize] = transforms.Compose(steps)
+    return _TRANSFORMS[normalize]
+
+# CHANGE: JPEGs decode in draft mode, i.e. libjpeg scales by 1/2, 1/4 or 1/8 while
+# decoding, so a 12MP phone photo comes out just above 224x224 instead of being
+# fully decoded and then thrown away by Resize (JPEG_DRAFT_DECODE=0 disables)
+JPEG_DRAFT_DECODE = os.environ.get("JPEG_DRAFT_DECODE", "1") != "0"
+DRAFT_SIZE = (224, 224)
+
+def open_image(fp):
+    """Decode an encoded image (path or file object) to RGB, near model size for JPEGs, EXIF orientation applied"""
+    img = Image.open(fp)
+    if JPEG_DRAFT_DECODE and img.format == "JPEG":
+        img.draft("RGB", DRAFT_SIZE)  # never scales below the requested size
+    ImageOps.exif_transpose(img, in_place=True)  # phone photos are often stored sideways
+    return img.convert('RGB')
+
+def load_image(source):
+    """Return an RGB PIL image from a PIL image, encoded bytes / file object, a NumPy array (HxW[xC]) or a file path"""
+    if isinstance(source, Image.Image):
+        return source.convert('RGB')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return open_image(io.BytesIO(source))
+    if hasattr(source, "read"):
+        return open_image(source)
+    if isinstance(source, np.ndarray):
+        arr = source
+        if arr.dtype != np.uint8:
+            # float arrays are expected in [0, 1]
+            arr = (np.clip(arr, 0.0, 1.0) * 255.0).round().astype(np.uint8)
+        if arr.ndim == 3 and arr.shape[2] == 1:
+            arr = arr[:, :, 0]
+        return Image.fromarray(arr).convert('RGB')
+    if isinstance(source, (str, os.PathLike)):
+        return open_image(source)
+    raise TypeError(f"Unsupported image source: {type(source).__name__}")
+
+def images_to_tensor(sources, device, normalize=True):
+    """Decode/transform a list of image sources straight from memory into a [N,3,224,224] batch"""
+    transform = image_transforms(normalize)
+    return torch.stack([transform(load_image(src)) for src in sources]).to(device)
+
 def preprocess_image(image_path, device):
     """Process image for model input"""
     try:
-        # Define image transformations
-        image_transforms = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-        
-        # Open image from file
-        image = Image.open(image_path).convert('RGB')
-        
-        # Apply transformations and prepare tensor
-        tensor = image_transforms(image).unsqueeze(0).to(device)
-        return tensor
+        return images_to_tensor([image_path], device)
     except Exception as e:
         print(f"Error preprocessing image: {e}")
         return None
 
-def predict(image_path, loaded_models, device):
-    """Predict skin lesion from image file (ensemble = mean of probabilities)."""
-    if not loaded_models:
-        print("Error: No models loaded for prediction")
-        return None
-
-    # Preprocess image
-    image_tensor = preprocess_image(image_path, device)
-    if image_tensor is None:
-        return None
-
+def _build_result(model_probs, ens_probs=None):
+    """Build the response dict for one image from {model_name: probs[7]} (and the averaged probs, if already computed)."""
     predictions = {}                       # per-backbone predictions
     num_classes = 7
     sum_probs = np.zeros(num_classes, dtype=np.float32)
 
-    with torch.no_grad():
-        for model_name, model in loaded_models.items():
-            logits = model(image_tensor)
-            probs = torch.softmax(logits, dim=1)[0].detach().cpu().numpy()  # shape [7]
-            pred_idx = int(probs.argmax())
+    for model_name, probs in model_probs.items():
+        pred_idx = int(probs.argmax())
 
-            predictions[model_name] = {
-                "class_id": pred_idx,
-                "class_name": CLASS_NAMES[pred_idx],
-                "confidence": float(probs[pred_idx]),   # 0..1 for this backbone
-            }
+        predictions[model_name] = {
+            "class_id": pred_idx,
+            "class_name": CLASS_NAMES[pred_idx],
+            "confidence": float(probs[pred_idx]),   # 0..1 for this backbone
+        }
 
-            sum_probs += probs
+        sum_probs += probs
 
     # ---- Ensemble by averaging probabilities (not voting) ----
-    n_models = max(1, len(loaded_models))
-    ens_probs = (sum_probs / n_models).astype(float)            # shape [7], sums ~1
+    n_models = max(1, len(model_probs))
+    if ens_probs is None:
+        ens_probs = sum_probs / n_models
+    ens_probs = np.asarray(ens_probs, dtype=float)              # shape [7], sums ~1
     top_idx = int(ens_probs.argmax())
     top_label = CLASS_NAMES[top_idx]
     top_prob = float(ens_probs[top_idx])                        # 0..1
@@ -227,16 +560,448 @@ def predict(image_path, loaded_models, device):
             "agreement": agreement,        # <-- optional, shows model consensus (0..1)
         },
         "model_predictions": predictions,  # per-backbone outputs
-        "class_probabilities": class_probs # ensemble distribution used for the bars
+        "class_probabilities": class_probs, # ensemble distribution used for the bars
+        "backbones_run": list(model_probs), # which backbones contributed (see cascade mode)
     }
     return result
 
+# ==== CASCADE MODE ====
+# Run the cheap backbone first and only escalate to the heavy ones when it is
+# unsure (low confidence / margin) or its top class is malignant.
+
+def cascade_config_from_env():
+    """Cascade settings from CASCADE_* env vars, or None when the cascade is off"""
+    if os.environ.get("CASCADE_MODE", "0") in ("", "0", "false", "off"):
+        return None
+    return {
+        "cheap_model": os.environ.get("CASCADE_CHEAP_MODEL", "mobilenetv3"),
+        "min_confidence": float(os.environ.get("CASCADE_MIN_CONFIDENCE", "0.85")),
+        "min_margin": float(os.environ.get("CASCADE_MIN_MARGIN", "0.5")),
+    }
+
+def cascade_escalate(probs, min_confidence, min_margin):
+    """Boolean mask over a [N,7] probability array: which images need the heavy backbones"""
+    ordered = np.sort(probs, axis=1)
+    top, second = ordered[:, -1], ordered[:, -2]
+    malignant = np.isin(probs.argmax(axis=1), [i for i, name in CLASS_NAMES.items() if name in MALIGNANT_CLASSES])
+    return (top < min_confidence) | ((top - second) < min_margin) | malignant
+
+def _forward(model_name, model, image_tensor, timings):
+    t0 = time.perf_counter()
+    logits = model(image_tensor)
+    captured = getattr(_CAPTURE, "active", None)
+    if captured is not None:
+        captured["logits"].setdefault(model_name, []).append(logits.detach().float().cpu())
+    probs = torch.softmax(logits, dim=1).detach().cpu().numpy()  # shape [N,7]
+    if timings is not None:
+        timings[f"forward_{model_name}"] = time.perf_counter() - t0
+    return probs
+
+def predict_tensor(image_tensor, loaded_models, timings=None, cascade=None):
+    """Run each backbone once over a [N,3,224,224] batch; returns one result dict per image.
+
+    If `timings` is a dict it receives per-backbone forward times in seconds ("forward_<name>").
+    `cascade` (see cascade_config_from_env) enables early exit on the cheap backbone.
+    """
+    n = image_tensor.shape[0]
+    with torch.no_grad():
+        if not cascade or cascade["cheap_model"] not in loaded_models or len(loaded_models) < 2:
+            batch_probs = {name: _forward(name, model, image_tensor, timings) for name, model in loaded_models.items()}
+            return [_build_result({name: probs[i] for name, probs in batch_probs.items()}) for i in range(n)]
+
+        cheap = cascade["cheap_model"]
+        cheap_probs = _forward(cheap, loaded_models[cheap], image_tensor, timings)
+        escalate = np.flatnonzero(cascade_escalate(cheap_probs, cascade["min_confidence"], cascade["min_margin"]))
+        heavy_probs = {}
+        if len(escalate):
+            subset = image_tensor[torch.as_tensor(escalate, device=image_tensor.device)]
+            heavy_probs = {name: _forward(name, model, subset, timings)
+                           for name, model in loaded_models.items() if name != cheap}
+
+    row_of = {int(i): row for row, i in enumerate(escalate)}
+    results = []
+    for i in range(n):
+        model_probs = {cheap: cheap_probs[i]}
+        if i in row_of:
+            model_probs.update({name: probs[row_of[i]] for name, probs in heavy_probs.items()})
+        result = _build_result(model_probs)
+        result["cascade"] = {"escalated": i in row_of}
+        results.append(result)
+    return results
+
+# ==== FUSED ENSEMBLE ====
+# FUSED_ENSEMBLE=script|eager: normalization, every backbone, softmax and the
+# average run as one module call, with a single host transfer per batch.
+_ENSEMBLE_MODULE = None
+
+def ensemble_module_class():
+    """EnsembleModule, defined on first use since it subclasses torch.nn.Module"""
+    global _ENSEMBLE_MODULE
+    if _ENSEMBLE_MODULE is not None:
+        return _ENSEMBLE_MODULE
+
+    class EnsembleModule(torch.nn.Module):
+        """All backbones in one graph: [N,3,H,W] in [0,1] -> (per-backbone probs [M,N,7], ensemble probs [N,7])"""
+
+        def __init__(self, loaded_models):
+            super().__init__()
+            backbones, channels_last = [], False
+            for model_name, model in loaded_models.items():
+                if isinstance(model, PrecisionModel):
+                    if model.mode == "bf16":
+                        raise ValueError(f"{model_name} runs under bf16 autocast, which cannot be fused")
+                    channels_last = channels_last or model.channels_last
+                    model = model.module
+                backbones.append(model)
+            self.names: List[str] = list(loaded_models)
+            self.channels_last = channels_last
+            self.backbones = torch.nn.ModuleList(backbones)
+            self.register_buffer("mean", torch.tensor(IMAGE_MEAN).view(1, 3, 1, 1))
+            self.register_buffer("std", torch.tensor(IMAGE_STD).view(1, 3, 1, 1))
+
+        def forward(self, x):
+            x = (x - self.mean) / self.std
+            if self.channels_last:
+                x = x.contiguous(memory_format=torch.channels_last)
+            probs = []
+            for backbone in self.backbones:
+                probs.append(torch.softmax(backbone(x), dim=1))
+            stacked = torch.stack(probs)
+            return stacked, stacked.mean(dim=0)
+
+    _ENSEMBLE_MODULE = EnsembleModule
+    return EnsembleModule
+
+def fuse_models(loaded_models, device, script=True):
+    """Wrap the loaded backbones in one EnsembleModule, TorchScript-compiled unless script=False"""
+    fused = ensemble_module_class()(loaded_models).to(device).eval()
+    if script:
+        try:
+            fused = torch.jit.script(fused)
+        except Exception as e:
+            print(f"Could not script the fused ensemble, running it eagerly: {e}")
+    print(f"Fused {len(fused.names)} backbones into one ensemble module ({'TorchScript' if script else 'eager'})")
+    return fused
+
+def predict_fused(image_tensor, fused, timings=None):
+    """Run a fused ensemble over an unnormalized [N,3,224,224] batch; returns one result dict per image."""
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        per_model, ensemble = fused(image_tensor)
+    per_model, ensemble = per_model.cpu().numpy(), ensemble.cpu().numpy()
+    if timings is not None:
+        timings["forward_ensemble"] = time.perf_counter() - t0
+    return [
+        _build_result({name: per_model[j, i] for j, name in enumerate(fused.names)}, ensemble[i])
+        for i in range(image_tensor.shape[0])
+    ]
+
+# ==== TEST-TIME AUGMENTATION ====
+# TTA_MODE=always|borderline: average every backbone's probabilities over
+# flipped / rotated / cropped views. All views of all selected images go
+# through each backbone as one batch (split into chunks of TTA_MAX_BATCH, past
+# which CPU throughput per image drops). "borderline" only re-runs images whose
+# first-pass agreement < TTA_MIN_AGREEMENT or confidence < TTA_MIN_CONFIDENCE.
+def _crop_view(x, top, left, scale=0.875):
+    size = x.shape[-1]
+    c = int(round(size * scale))
+    top, left = int(top * (size - c)), int(left * (size - c))
+    return F.interpolate(x[..., top:top + c, left:left + c], size=(size, size), mode="bilinear", align_corners=False)
+
+# every view is per-channel linear, so it applies to normalized and raw (fused) tensors alike
+TTA_VIEWS = {
+    "hflip": lambda x: x.flip(3),
+    "vflip": lambda x: x.flip(2),
+    "rot90": lambda x: torch.rot90(x, 1, (2, 3)),
+    "rot180": lambda x: torch.rot90(x, 2, (2, 3)),
+    "rot270": lambda x: torch.rot90(x, 3, (2, 3)),
+    "crop_center": lambda x: _crop_view(x, 0.5, 0.5),
+    "crop_tl": lambda x: _crop_view(x, 0.0, 0.0),
+    "crop_tr": lambda x: _crop_view(x, 0.0, 1.0),
+    "crop_bl": lambda x: _crop_view(x, 1.0, 0.0),
+    "crop_br": lambda x: _crop_view(x, 1.0, 1.0),
+}
+
+def tta_config_from_env():
+    """TTA settings from TTA_* env vars, or None when TTA is off"""
+    mode = os.environ.get("TTA_MODE", "off").lower()
+    if mode in ("", "0", "off", "false"):
+        return None
+    if mode not in ("always", "borderline"):
+        raise ValueError(f"Unknown TTA_MODE {mode!r} (expected 'always', 'borderline' or 'off')")
+    views = [v.strip() for v in os.environ.get("TTA_VIEWS", "hflip,vflip,rot90,crop_center").split(",") if v.strip()]
+    unknown = [v for v in views if v not in TTA_VIEWS]
+    if unknown:
+        raise ValueError(f"Unknown TTA_VIEWS {unknown} (expected some of {list(TTA_VIEWS)})")
+    return {
+        "mode": mode,
+        "views": views,
+        "min_agreement": float(os.environ.get("TTA_MIN_AGREEMENT", "1.0")),
+        "min_confidence": float(os.environ.get("TTA_MIN_CONFIDENCE", "0.6")),
+        "max_batch": int(os.environ.get("TTA_MAX_BATCH", "16")),
+    }
+
+def _needs_tta(result, tta):
+    pred = result["prediction"]
+    return pred["agreement"] < tta["min_agreement"] or pred["confidence"] < tta["min_confidence"]
+
+def _view_probs(views, loaded_models, fused, max_batch=None):
+    """{model_name: probs [B,7]} for a batch of views, one forward per backbone (or fused call) per chunk"""
+    chunks = torch.split(views, max_batch) if max_batch else [views]
+    with torch.no_grad():
+        if fused is not None:
+            per_model = np.concatenate([fused(chunk)[0].cpu().numpy() for chunk in chunks], axis=1)
+            return {name: per_model[j] for j, name in enumerate(fused.names)}
+        # through _forward so an active embeddings capture also records the views' logits
+        return {name: np.concatenate([_forward(name, model, chunk, None) for chunk in chunks])
+                for name, model in loaded_models.items()}
+
+def apply_tta(image_tensor, results, loaded_models, tta, timings=None, fused=None):
+    """Replace the results of the selected images with view-averaged ones (in place); returns results"""
+    t0 = time.perf_counter()
+    n = image_tensor.shape[0]
+    targets = list(range(n)) if tta["mode"] == "always" else [i for i, r in enumerate(results) if _needs_tta(r, tta)]
+    # with the cascade, an image is re-run on the backbones its first pass used, so TTA never escalates it
+    groups = {}
+    for i in targets:
+        previous = results[i]
+        backbones = tuple(previous["backbones_run"]) if previous and "cascade" in previous else tuple(loaded_models)
+        groups.setdefault(backbones, []).append(i)
+    n_views = 1 + len(tta["views"])
+    for backbones, group in groups.items():
+        subset = image_tensor[torch.as_tensor(group, device=image_tensor.device)]
+        # [(1 + V) * k, 3, 224, 224], view-major: the original first, then each augmentation
+        views = torch.cat([subset] + [TTA_VIEWS[v](subset) for v in tta["views"]])
+        models = {name: loaded_models[name] for name in backbones}
+        probs = {name: p.reshape(n_views, len(group), -1).mean(axis=0)
+                 for name, p in _view_probs(views, models, fused, tta.get("max_batch")).items()}
+        for row, i in enumerate(group):
+            previous = results[i]
+            results[i] = _build_result({name: p[row] for name, p in probs.items()})
+            if previous and "cascade" in previous:
+                results[i]["cascade"] = previous["cascade"]
+    seconds = time.perf_counter() - t0
+    applied = set(targets)
+    # pass_ms is the whole TTA pass (original view included); in "always" mode it replaces
+    # the normal pass rather than adding to it
+    for i, result in enumerate(results):
+        result["tta"] = {"applied": i in applied, "views": 1 + len(tta["views"]) if i in applied else 1,
+                         "pass_ms": seconds * 1000.0 if i in applied else 0.0}
+    if timings is not None:
+        timings["tta"] = seconds
+    return results
+
+# ==== EMBEDDINGS ====
+# The penultimate-layer features of each backbone (the input of its final
+# Linear) are captured by a forward pre-hook during the normal prediction pass,
+# so asking for them costs a copy, not another forward. Captures are
+# thread-local: concurrent inference threads never see each other's.
+_CAPTURE = threading.local()
+
+def classifier_head(model_name, model):
+    """The final Linear of a backbone from build_model, or None where hooks cannot be attached"""
+    module = getattr(model, "module", model)  # unwrap PrecisionModel
+    if not isinstance(module, torch.nn.Module):
+        return None  # e.g. an ONNX Runtime session (INFERENCE_BACKEND=onnx)
+    if isinstance(module, torch.jit.ScriptModule):
+        return None  # TorchScript artifacts (MODEL_CACHE_DIR) run without Python hooks
+    if 'resnet' in model_name:
+        return module.fc
+    if 'densenet' in model_name:
+        return module.classifier
+    if 'mobilenet' in model_name:
+        return module.classifier[3]
+    return None
+
+def _capture_hook(model_name, module, inputs):
+    captured = getattr(_CAPTURE, "active", None)
+    if captured is not None:
+        captured["embeddings"].setdefault(model_name, []).append(inputs[0].detach().float().cpu())
+
+def attach_embedding_hooks(loaded_models):
+    """Register the capture hook on every backbone that supports it; returns their names"""
+    hooked = []
+    for model_name, model in loaded_models.items():
+        head = classifier_head(model_name, model)
+        if head is None:
+            print(f"Warning: no embeddings for {model_name} (TorchScript artifact)")
+            continue
+        head.register_forward_pre_hook(lambda module, inputs, name=model_name: _capture_hook(name, module, inputs))
+        hooked.append(model_name)
+    return hooked
+
+@contextmanager
+def capture_embeddings():
+    """Collect embeddings / logits of every forward in this thread: {"embeddings": {name: [tensor]}, "logits": ...}"""
+    previous = getattr(_CAPTURE, "active", None)
+    _CAPTURE.active = {"embeddings": {}, "logits": {}}
+    try:
+        yield _CAPTURE.active
+    finally:
+        _CAPTURE.active = previous
+
+def _attach_embeddings(results, captured, cheap=None):
+    """Add each image's embeddings and logits (original view, first pass) to its result, as float32 arrays.
+
+    The first pass comes first in each capture (TTA views are appended after it, or
+    follow the original view in the same batch). With the cascade, the heavy backbones
+    only saw the escalated images, in order, so only those get their vectors.
+    """
+    features = {kind: {name: torch.cat(chunks).numpy() for name, chunks in by_model.items()}
+                for kind, by_model in captured.items()}
+    heavy_row = -1
+    for i, result in enumerate(results):
+        escalated = bool((result.get("cascade") or {}).get("escalated"))
+        heavy_row += escalated
+        for kind, by_model in features.items():
+            result[kind] = {}
+            for model_name, rows in by_model.items():
+                if cheap is None or model_name == cheap:
+                    result[kind][model_name] = rows[i]
+                elif escalated:
+                    result[kind][model_name] = rows[heavy_row]
+    return results
+
+def _has_hook(model_name, model):
+    head = classifier_head(model_name, model)
+    return head is not None and bool(head._forward_pre_hooks)
+
+def _check_embeddings(results, loaded_models, fused=None, cheap=None):
+    """Raise if a result lacks the embeddings / logits of a backbone its first pass ran (hooked ones only)"""
+    for i, result in enumerate(results):
+        escalated = bool((result.get("cascade") or {}).get("escalated"))
+        ran = [cheap] if cheap is not None and not escalated else list(loaded_models)
+        expected = {
+            "embeddings": {name for name in ran if _has_hook(name, loaded_models[name])},
+            "logits": set(ran) if fused is None else set(),  # the fused graph only returns probabilities
+        }
+        for kind, names in expected.items():
+            if set(result[kind]) != names:
+                raise RuntimeError(f"incomplete {kind} for image {i}: got {sorted(result[kind])}, expected {sorted(names)}")
+    return results
+
+def predict_batch(sources, loaded_models, device, timings=None, cascade=None, fused=None, tta=None, embeddings=False):
+    """In-memory entry point: predict a list of PIL images / bytes / arrays / paths in one ensemble pass.
+
+    With embeddings=True each result also carries "embeddings" and "logits": {model_name: float32 array}
+    from the same pass (backbones with hooks only; logits are not available from the fused ensemble).
+    """
+    if not sources:
+        return []
+    if embeddings:
+        with capture_embeddings() as captured:
+            results = predict_batch(sources, loaded_models, device, timings, cascade, fused, tta)
+        cheap = cascade["cheap_model"] if cascade is not None and any("cascade" in r for r in results) else None
+        return _check_embeddings(_attach_embeddings(results, captured, cheap), loaded_models, fused, cheap)
+    t0 = time.perf_counter()
+    image_tensor = images_to_tensor(sources, device, normalize=fused is None)
+    if timings is not None:
+        timings["preprocess"] = time.perf_counter() - t0
+    if tta and tta["mode"] == "always":
+        # the TTA batch already contains the original view; no separate first pass
+        return apply_tta(image_tensor, [None] * len(sources), loaded_models, tta, timings, fused)
+    if fused is not None:
+        results = predict_fused(image_tensor, fused, timings)
+    else:
+        results = predict_tensor(image_tensor, loaded_models, timings, cascade)
+    if tta:
+        apply_tta(image_tensor, results, loaded_models, tta, timings, fused)
+    return results
+
+def predict(image_path, loaded_models, device):
+    """Predict skin lesion from image file (ensemble = mean of probabilities)."""
+    if not loaded_models:
+        print("Error: No models loaded for prediction")
+        return None
+
+    # Preprocess image
+    image_tensor = preprocess_image(image_path, device)
+    if image_tensor is None:
+        return None
+
+    return predict_tensor(image_tensor, loaded_models)[0]
+
+def _print_result(result, image_path):
+    print("\n=== PREDICTION RESULTS ===")
+    print(f"Classification: {result['prediction']['display_name']}")
+    print(f"Risk Level: {result['prediction']['risk']}")
+    print(f"Description: {result['prediction']['description']}")
+    print(f"Recommendation: {result['prediction']['recommendation']}")
+    print(f"Confidence: {result['prediction']['confidence'] * 100:.2f}%\n")
+    
+    print("Individual Model Predictions:")
+    for model_name, pred in result['model_predictions'].items():
+        print(f"  - {model_name}: {CLASS_INFO[pred['class_name']]['display']} (Confidence: {pred['confidence'] * 100:.2f}%)")
+    
+    print("\nClass Probabilities:")
+    for class_name, prob in result['class_probabilities'].items():
+        print(f"  - {CLASS_INFO[class_name]['display']}: {prob * 100:.2f}%")
+    
+    # Save results to JSON file
+    output_filename = f"{os.path.splitext(os.path.basename(image_path))[0]}_prediction.json"
+    with open(output_filename, "w") as f:
+        json.dump(result, f, indent=4)
+    print(f"\nResults also saved to {output_filename}")
+
+# ==== CLI DAEMON ====
+# `python app.py --daemon` keeps the models loaded; later `python app.py -f ...`
+# calls send the image path over a local socket instead of loading the models
+# again (see cli_daemon.py). The daemon answers exactly like the one-shot CLI.
+def _weights_version(models_dir):
+    return weights_version({name: f["sha256"] for name, f in _model_files(models_dir).items()})
+
+def _cli_model_set(models_dir):
+    version = _weights_version(models_dir)
+    loaded_models, device = load_models(models_dir)
+    return ModelSet(loaded_models, device, version)
+
+def _run_daemon(models_dir, socket_path, idle_timeout):
+    registry = ModelRegistry(lambda: _cli_model_set(models_dir))
+    if registry.ensure().models is None:
+        print("Error: Could not load any models. Exiting.")
+        return
+
+    def handle(payload):
+        op = payload.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "models_dir": models_dir, "model_version": registry.active.version}
+        if op != "predict":
+            return {"error": f"unknown op {op!r}"}
+        if payload.get("models_dir") != models_dir:
+            return {"error": f"this daemon serves the models in {models_dir}"}
+        if _weights_version(models_dir) != registry.active.version:
+            registry.reload()  # weight files changed since they were loaded
+        model_set = registry.active
+        result = predict_batch([payload["path"]], model_set.models, model_set.device)[0]
+        return {"result": result, "model_version": model_set.version}
+
+    cli_daemon.serve(handle, socket_path, idle_timeout)
+
+def _predict_via_daemon(image_path, models_dir, socket_path):
+    """Result from a running CLI daemon, or None if there is none (or it could not answer)"""
+    try:
+        response = cli_daemon.request(
+            {"op": "predict", "path": os.path.abspath(image_path), "models_dir": models_dir}, socket_path)
+    except (OSError, ValueError):
+        return None
+    if "result" not in response:
+        print(f"CLI daemon could not predict ({response.get('error')}); loading models in this process")
+        return None
+    print(f"Predicted by the CLI daemon (model version {response['model_version']})")
+    return response["result"]
+
 def main():
     """Main function to run the script"""
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Please Input the Name of your File: ')
     parser.add_argument('-f', '--file', help='Path to input file')
     parser.add_argument('--models', type=str, help='Path to the models directory (default: auto-detect)')
+    parser.add_argument('--export-fused', metavar='PATH', help='Save the backbones as one TorchScript ensemble module and exit')
+    parser.add_argument('--daemon', action='store_true', help='Keep the models loaded and answer later CLI calls over a local socket')
+    parser.add_argument('--stop-daemon', action='store_true', help='Stop a running CLI daemon')
+    parser.add_argument('--no-daemon', action='store_true', help='Load the models in this process even if a daemon is running')
+    parser.add_argument('--socket', help='CLI daemon socket (default: APP_DAEMON_SOCKET or a per-user path)')
+    parser.add_argument('--idle-timeout', type=float, default=1800, help='Seconds without requests before the daemon exits (0 = never)')
     args = parser.parse_args()
     
     # Get the directory where this script is located
@@ -244,6 +1009,31 @@ def main():
     
     # Define models directory path
     models_dir = args.models if args.models else os.environ.get("MODELS_DIR", os.path.join(script_dir, "models"))
+    models_dir = os.path.abspath(resolve_models_dir(models_dir))
+
+    socket_path = args.socket or cli_daemon.default_socket_path()
+    if args.stop_daemon:
+        try:
+            cli_daemon.request({"op": "shutdown"}, socket_path, timeout=10.0)
+            print("CLI daemon stopped")
+        except OSError:
+            print(f"No CLI daemon running on {socket_path}")
+        return
+    if args.daemon:
+        if not cli_daemon.available():
+            print("Error: the CLI daemon needs Unix domain sockets")
+            return
+        _run_daemon(models_dir, socket_path, args.idle_timeout)
+        return
+    if args.export_fused:
+        loaded_models, device = load_models(models_dir)
+        if not loaded_models:
+            print("Error: Could not load any models. Exiting.")
+            return
+        fused = fuse_models(loaded_models, device)
+        torch.jit.save(fused, args.export_fused)
+        print(f"Fused ensemble saved to {args.export_fused} (input: [N,3,224,224] RGB in [0,1])")
+        return
     
     # Process the file argument
     if args.file:
@@ -253,7 +1043,7 @@ def main():
         print('File not specified')
         # Default image path if file not specified
         image_path = os.path.join(script_dir, "melanoma.jpeg")
-        
+
     print(f"Processing image: {image_path}")
     print(f"Script directory: {script_dir}")
     print(f"Looking for models in: {models_dir}")
@@ -262,7 +1052,7 @@ def main():
     if not os.path.exists(image_path):
         # Try to find the image in the parent directory structure
         print("Image not found at the expected location. Searching...")
-        for root, dirs, files in os.walk(os.path.dirname(script_dir)):
+        for root, dirs, files in _walk_project(os.path.dirname(script_dir)):
             image_filename = os.path.basename(image_path)
             if image_filename in files:
                 image_path = os.path.join(root, image_filename)
@@ -274,93 +1064,234 @@ def main():
             print(f"Error: Could not find image {image_path} anywhere!")
             return
     
-    # Load models and make prediction
-    loaded_models, device = load_models(models_dir)
-    if not loaded_models:
-        print("Error: Could not load any models. Exiting.")
-        return
-        
-    result = predict(image_path, loaded_models, device)
+    # CHANGE: reuse the models of a running CLI daemon when there is one
+    result = None
+    if not args.no_daemon and cli_daemon.available():
+        result = _predict_via_daemon(image_path, models_dir, socket_path)
+
+    if result is None:
+        # Load models and make prediction
+        loaded_models, device = load_models(models_dir)
+        if not loaded_models:
+            print("Error: Could not load any models. Exiting.")
+            return
+
+        try:
+            result = predict_batch([image_path], loaded_models, device)[0]
+        except Exception as e:
+            print(f"Error preprocessing image: {e}")
+            result = None
     if not result:
         print("Error: Could not make prediction. Exiting.")
         return
     
     # Print results
-    print("\n=== PREDICTION RESULTS ===")
-    print(f"Classification: {result['prediction']['display_name']}")
-    print(f"Risk Level: {result['prediction']['risk']}")
-    print(f"Description: {result['prediction']['description']}")
-    print(f"Recommendation: {result['prediction']['recommendation']}")
-    print(f"Confidence: {result['prediction']['confidence'] * 100:.2f}%\n")
-    
-    print("Individual Model Predictions:")
-    for model_name, pred in result['model_predictions'].items():
-        print(f"  - {model_name}: {CLASS_INFO[pred['class_name']]['display']} (Confidence: {pred['confidence'] * 100:.2f}%)")
-    
-    print("\nClass Probabilities:")
-    for class_name, prob in result['class_probabilities'].items():
-        print(f"  - {CLASS_INFO[class_name]['display']}: {prob * 100:.2f}%")
-    
-    # Save results to JSON file
-    output_filename = f"{os.path.splitext(os.path.basename(image_path))[0]}_prediction.json"
-    with open(output_filename, "w") as f:
-        json.dump(result, f, indent=4)
-    print(f"\nResults also saved to {output_filename}")
+    _print_result(result, image_path)
 
 # ==== FASTAPI INTEGRATION WRAPPER (add this) ====
 # CHANGE: Keep models in memory for repeated API calls
 from PIL import Image as _PilImage
-import tempfile as _temp
 import os as _os
 
-# Global cache for models/device
-_LOADED_MODELS = None
-_DEVICE = None
+from registry import ModelRegistry, ModelSet, file_sha256
+import cli_daemon
+import cpu_config
+
+_CASCADE = cascade_config_from_env()
+_TTA = tta_config_from_env()
+
+def _models_dir():
+    # CHANGE: allow MODELS_DIR override via env; default to ./models next to this file
+    script_dir = _os.path.dirname(_os.path.abspath(__file__))
+    return resolve_models_dir(_os.environ.get("MODELS_DIR", _os.path.join(script_dir, "models")))
+
+def _model_files(models_dir):
+    """{model_name: {source, size, mtime, sha256}} for the weight files a load from models_dir uses"""
+    return {name: dict(_source_signature(path), sha256=file_sha256(path))
+            for name, path in find_model_files(models_dir).items()}
+
+def _build_model_set():
+    """Load a complete model set from the current configuration (see ModelRegistry)"""
+    # CHANGE: explicit torch thread counts and per-worker CPU pinning (see cpu_config.py); once per process,
+    # on the first load, so serve.py's parent process (which only exports weights) never takes a CPU slot
+    cpu_config.configure(torch)
+    models_dir = _models_dir()
+    # checksums first: if a file changes while loading, the next models_changed() check catches it
+    files = _model_files(models_dir)
+    version = weights_version({name: f["sha256"] for name, f in files.items()})
+
+    # CHANGE: INFERENCE_BACKEND=onnx serves from ONNX Runtime sessions (see onnx_backend.py)
+    backend = _os.environ.get("INFERENCE_BACKEND", "torch").lower()
+    # CHANGE: multi-worker serving (serve.py) points every worker at one shared weight store
+    store_dir = _os.environ.get("SHARED_WEIGHTS_DIR")
+    if backend == "onnx":
+        import onnx_backend
+        loaded_models, device, _ = onnx_backend.load_onnx_models(onnx_backend.ensure_exported(models_dir))
+        version = weights_version({"weights": version, "backend": backend})
+    elif backend != "torch":
+        raise ValueError(f"Unknown INFERENCE_BACKEND {backend!r} (expected 'torch' or 'onnx')")
+    elif store_dir:
+        # after a weight change (hot reload) the first worker re-exports; every worker maps the shared copy
+        if ensure_weight_store(store_dir, models_dir):
+            print(f"Re-exported weight store {store_dir} from {models_dir}")
+        loaded_models, device = load_weight_store(store_dir)
+    else:
+        loaded_models, device = load_models(models_dir=models_dir)
+
+    # CHANGE: optional reduced-precision modes per backbone (CPU)
+    precision = _os.environ.get("MODEL_PRECISION", "")
+    if precision and backend == "onnx":
+        print("Warning: MODEL_PRECISION only applies to the torch backend; ignored")
+    elif precision and loaded_models and device.type == "cpu":
+        loaded_models = apply_precision(loaded_models, precision)
+        version = weights_version({"weights": version, "precision": precision})
+    if _CASCADE:
+        # cascade results differ from the full ensemble, so they must not share cache entries
+        version = weights_version({"weights": version, "cascade": _CASCADE})
+    if _TTA:
+        version = weights_version({"weights": version, "tta": _TTA})
+    # CHANGE: optional single-graph ensemble (FUSED_ENSEMBLE=script|eager)
+    fused = None
+    fused_mode = _os.environ.get("FUSED_ENSEMBLE", "0").lower()
+    if fused_mode not in ("", "0", "false", "off") and loaded_models:
+        if backend == "onnx":
+            print("Warning: FUSED_ENSEMBLE only applies to the torch backend; ignored")
+        elif _CASCADE:
+            print("Warning: FUSED_ENSEMBLE is ignored in cascade mode (it always runs every backbone)")
+        else:
+            try:
+                fused = fuse_models(loaded_models, device, script=fused_mode != "eager")
+            except ValueError as e:
+                print(f"Warning: not fusing the ensemble: {e}")
+    # CHANGE: penultimate embeddings for /similar, captured from the prediction's own forward pass.
+    # After precision (int8 swaps the Linear layers) and fusion (a scripted graph runs without Python hooks).
+    embeddings = []
+    if loaded_models and backend == "torch" and (fused is None or not isinstance(fused, torch.jit.ScriptModule)):
+        embeddings = attach_embedding_hooks(loaded_models)
+    return ModelSet(loaded_models, device, version, fused, files, embeddings)
+
+def _warm(model_set):
+    """Dummy inferences on a model set; TorchScript models profile on their first calls, so more than one"""
+    t_warm = []
+    for _ in range(max(1, int(_os.environ.get("WARMUP_ITERATIONS", "2")))):
+        t0 = time.perf_counter()
+        dummy = torch.zeros(1, 3, 224, 224, device=model_set.device)
+        if model_set.fused is not None:
+            predict_fused(dummy, model_set.fused)
+        else:
+            predict_tensor(dummy, model_set.models)
+        t_warm.append(time.perf_counter() - t0)
+    return t_warm
+
+# CHANGE: the active model set lives in a registry so new weights can be swapped in without a restart
+REGISTRY = ModelRegistry(_build_model_set, prepare=_warm)
 
 def _ensure_loaded():
-    """Load models once and reuse (idempotent)."""
-    global _LOADED_MODELS, _DEVICE
-    if _LOADED_MODELS is None:
-        # CHANGE: allow MODELS_DIR override via env; default to ./models next to this file
-        script_dir = _os.path.dirname(_os.path.abspath(__file__))
-        models_dir = _os.environ.get("MODELS_DIR", _os.path.join(script_dir, "models"))
-        _LOADED_MODELS, _DEVICE = load_models(models_dir=models_dir)
-
-def predict_image(image: _PilImage.Image, user_id=None, meta=None):
-    """
-    CHANGE: FastAPI will call this version with a PIL Image.
-    We save to a temp file and reuse your existing `predict(image_path, loaded_models, device)`.
-    """
-    _ensure_loaded()
-    if _LOADED_MODELS is None:
+    """Load models once and reuse (idempotent); returns the active ModelSet."""
+    return REGISTRY.ensure()
+
+def _active_models():
+    model_set = _ensure_loaded()
+    if model_set.models is None:
         raise RuntimeError("Models failed to load; check MODELS_DIR and weight files.")
+    return model_set
+
+def model_version():
+    """Version id of the active model set (None until models are loaded)"""
+    model_set = REGISTRY.active
+    return model_set.version if model_set is not None and model_set.models is not None else None
 
-    # Save PIL image to a temporary file so we can reuse your preprocess path
-    tmp_path = None
+def models_changed():
+    """True if the weight files' contents differ from the ones the active set was loaded from"""
+    model_set = REGISTRY.active
+    if model_set is None:
+        return False
+    # checksums are cached per (size, mtime), so only files that were touched get re-hashed
+    current = {name: f["sha256"] for name, f in _model_files(_models_dir()).items()}
+    return current != {name: f["sha256"] for name, f in model_set.files.items()}
+
+def reload_models(force=False):
+    """Load the current weight files into a new set and swap it in; in-flight requests finish on the old one"""
+    if not force and model_version() is not None and not models_changed():
+        return {"swapped": False, "version": model_version(), "previous": model_version(), "reload_s": 0.0}
+    result = REGISTRY.reload(force=force)
+    print("Model reload: " + (f"{result['previous']} -> {result['version']}" if result["swapped"]
+                               else f"{result['version']} unchanged") + f" ({result['reload_s']:.2f}s)")
+    return result
+
+def model_status():
+    return dict(REGISTRY.status(), cpu=cpu_config.status())
+
+def warm_up():
+    """Load models (if needed) and run one dummy inference so the first real request is fast"""
+    t0 = time.perf_counter()
+    model_set = _ensure_loaded()
+    if model_set.models is None:
+        raise RuntimeError("Models failed to load; check MODELS_DIR and weight files.")
+    t_load = time.perf_counter() - t0
+
+    t_warm = _warm(model_set)
+    print(f"Warm-up complete: load {t_load:.2f}s, inference " + ", ".join(f"{t:.2f}s" for t in t_warm))
+    return {"load_s": t_load, "warmup_inference_s": t_warm, "models": dict(LOAD_TIMINGS),
+            "model_version": model_set.version}
+
+_WORKER_WARM_UP = None
+
+def warm_up_worker():
+    """Process-pool initializer: load and warm this worker's models as the process starts"""
+    global _WORKER_WARM_UP
     try:
-        with _temp.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-            image_rgb = image.convert("RGB")
-            image_rgb.save(tmp.name, format="JPEG", quality=95)
-            tmp_path = tmp.name
-
-        # Call your original predictor (ensemble) – returns the final dict your UI expects
-        result = predict(tmp_path, _LOADED_MODELS, _DEVICE)
-
-        # (Optional) attach passthrough info
-        if isinstance(result, dict):
-            if user_id is not None:
-                result["user_id"] = user_id
-            if meta is not None:
-                result["meta"] = meta
-
-        return result
-    finally:
-        # Clean up the temp file
-        if tmp_path:
-            try:
-                _os.remove(tmp_path)
-            except Exception:
-                pass
+        _WORKER_WARM_UP = warm_up()
+    except Exception as e:
+        # an initializer that raises breaks the whole pool; worker_warm_up() / the first request report it instead
+        print(f"Warning: worker warm-up failed: {e}")
+
+def worker_warm_up():
+    """The warm-up report of this worker's initializer, or a fresh warm-up if that failed"""
+    return _WORKER_WARM_UP if _WORKER_WARM_UP is not None else warm_up()
+
+def embedding_version(model_set):
+    """Identity of the weights behind a model set's embeddings (unaffected by cascade / TTA / backend settings)"""
+    return weights_version({name: f["sha256"] for name, f in model_set.files.items()})
+
+def predict_image(image: _PilImage.Image, user_id=None, meta=None, embeddings=False):
+    """
+    CHANGE: FastAPI will call this version with a PIL Image (bytes / NumPy arrays work too).
+    The image goes straight from memory into the ensemble; no temp-file JPEG round trip.
+    embeddings=True adds the per-backbone "embeddings" / "logits" of the same forward pass.
+    """
+    model_set = _active_models()  # one snapshot for the whole request, even if a reload swaps meanwhile
+
+    timings = {}
+    result = predict_batch([image], model_set.models, model_set.device, timings, _CASCADE, model_set.fused, _TTA,
+                           embeddings=embeddings)[0]
+    result["model_version"] = model_set.version
+    if embeddings:
+        result["embedding_version"] = embedding_version(model_set)
+    result["timings"] = timings  # stage seconds; the server turns these into metrics
+
+    # (Optional) attach passthrough info
+    if isinstance(result, dict):
+        if user_id is not None:
+            result["user_id"] = user_id
+        if meta is not None:
+            result["meta"] = meta
+
+    return result
+
+def predict_image_batch(images):
+    """
+    Batched counterpart of `predict_image` used by the server's micro-batcher:
+    one forward pass per backbone for the whole list, one result dict per image.
+    """
+    model_set = _active_models()
+
+    timings = {}
+    results = predict_batch(images, model_set.models, model_set.device, timings, _CASCADE, model_set.fused, _TTA)
+    for result in results:
+        result["model_version"] = model_set.version
+        result["timings"] = dict(timings)  # shared by every image of the batch
+    return results
 # ==== END WRAPPER ====
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+# batching.py
+"""
+Dynamic micro-batching for the /predict path.
+
+Concurrent requests are parked on an asyncio queue; a single consumer task
+drains up to `max_batch_size` items (waiting at most `max_wait_ms` for the
+batch to fill), runs `batch_fn(items)` once off the event loop and resolves
+each awaiting request with its own result. Up to `concurrency` batches run at
+once (one per executor worker); while all are busy the queue keeps filling,
+so the next batch is usually a full one.
+"""
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        executor=None,
+        concurrency: int = 1,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.executor = executor  # None -> loop's default thread pool
+        self.concurrency = max(1, int(concurrency))
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._running: set = set()  # in-flight batch tasks
+
+        # metrics
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._batch_sizes: Counter = Counter()
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._run_total = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        """Enqueue one item and wait for its result."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # queue and consumer task are bound to the loop that created them
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = None
+            self._running = set()
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run(self._queue))
+
+        fut = loop.create_future()
+        await self._queue.put((item, fut, time.perf_counter()))
+        return await fut
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._running:
+            # let batches already handed to the executor resolve their callers
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _collect(self, queue: asyncio.Queue) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            # take whatever is already queued without waiting
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            await slots.acquire()
+            try:
+                batch = await self._collect(queue)
+            except BaseException:
+                slots.release()
+                raise
+            # drop requests whose caller already went away
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                slots.release()
+                continue
+            task = loop.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run_batch(self, batch: list):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            waited = started - enqueued
+            self._queue_wait_total += waited
+            self._queue_wait_max = max(self._queue_wait_max, waited)
+
+        items = [item for item, _, _ in batch]
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"batch_fn returned {len(results)} results for {len(items)} inputs")
+        except Exception as e:
+            self._errors += 1
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for (_, fut, _), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+        finally:
+            self._run_total += time.perf_counter() - started
+            self._batches += 1
+            self._items += len(items)
+            self._batch_sizes[len(items)] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        batches = max(1, self._batches)
+        items = max(1, self._items)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "concurrency": self.concurrency,
+            "in_flight": len(self._running),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self._batches,
+            "items": self._items,
+            "errors": self._errors,
+            "avg_batch_size": self._items / batches if self._batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+            "avg_queue_wait_ms": 1000.0 * self._queue_wait_total / items if self._items else 0.0,
+            "max_queue_wait_ms": 1000.0 * self._queue_wait_max,
+            "avg_batch_run_ms": 1000.0 * self._run_total / batches if self._batches else 0.0,
+        }
@@ -0,0 +1,218 @@
+# benchmarks/autotune_threads.py
+"""
+Find the worker / thread / pinning setup with the best ensemble throughput on
+this machine at a target p95 latency.
+
+    python benchmarks/autotune_threads.py --target-p95-ms 800
+    python benchmarks/autotune_threads.py --workers 1,2,4 --intra 1,2,4 --inter 1 --inference-workers 1,2 --duration 20
+
+Each candidate (worker processes x TORCH_INTRA_OP_THREADS x
+TORCH_INTER_OP_THREADS x INFERENCE_WORKERS, with and without CPU pinning) runs
+as real worker processes, configured through the same environment variables
+the service reads (see cpu_config.py) and loading models the way the service
+does (MODEL_PRECISION, FUSED_ENSEMBLE, INFERENCE_BACKEND, ... apply). Once all
+workers are loaded and warm, each runs INFERENCE_WORKERS threads calling
+predict_batch back to back on the sample images for --duration seconds, as
+the server's inference pool does under load. Latency is per call (one
+micro-batch of --batch-size images, decode excluded); throughput is images/s
+summed over the workers. The recommendation is the highest throughput whose p95 meets the
+target. Results are written as JSON (default: benchmarks/results/autotune-<timestamp>.json).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+from common import DEFAULT_MODELS_DIR, SERVICE_DIR, core, percentiles, reference_images, weights_dir_or_random
+
+import cpu_config  # noqa: E402 (on sys.path via common)
+
+_MARKER = "AUTOTUNE "  # prefix of the worker's JSON lines; model loading logs go to stdout too
+
+
+def _ints(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _powers_of_two(limit):
+    values, n = [], 1
+    while n <= limit:
+        values.append(n)
+        n *= 2
+    return sorted(set(values + [limit]))
+
+
+def run_worker(args):
+    """One benchmark worker: load, warm up, wait for "go" on stdin, then run for --duration seconds"""
+    model_set = core._active_models()
+    images = [img for _, img in reference_images()]
+    batch = [images[i % len(images)] for i in range(args.batch_size)]
+
+    def call():
+        core.predict_batch(batch, model_set.models, model_set.device,
+                           cascade=core._CASCADE, fused=model_set.fused, tta=core._TTA)
+
+    for _ in range(2):
+        call()
+    print(_MARKER + json.dumps({"ready": True, "cpu": cpu_config.status()}), flush=True)
+    sys.stdin.readline()
+
+    # concurrent callers in one process, like the server's INFERENCE_WORKERS pool threads
+    callers = max(1, int(os.environ.get("INFERENCE_WORKERS", "1")))
+    samples = [[] for _ in range(callers)]
+    started = time.perf_counter()
+
+    def loop(out):
+        while time.perf_counter() - started < args.duration:
+            t0 = time.perf_counter()
+            call()
+            out.append((time.perf_counter() - t0) * 1000.0)
+
+    threads = [threading.Thread(target=loop, args=(out,)) for out in samples]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(_MARKER + json.dumps({"latencies_ms": [ms for out in samples for ms in out],
+                                "elapsed_s": time.perf_counter() - started}), flush=True)
+
+
+def _read_marked(proc):
+    for line in proc.stdout:
+        if line.startswith(_MARKER):
+            return json.loads(line[len(_MARKER):])
+    raise RuntimeError(f"benchmark worker exited with code {proc.wait()} before reporting")
+
+
+def run_candidate(workers, intra, inter, callers, pinned, args, models_dir):
+    cpus = cpu_config.available_cpus()
+    procs = []
+    for i in range(workers):
+        env = dict(os.environ,
+                   MODELS_DIR=models_dir,
+                   TORCH_INTRA_OP_THREADS=str(intra),
+                   TORCH_INTER_OP_THREADS=str(inter),
+                   CPU_AFFINITY=cpu_config.format_cpu_list(cpu_config.split_cpus(cpus, workers, i)) if pinned else "",
+                   CPU_AFFINITY_SLOTS="1",
+                   INFERENCE_WORKERS=str(callers))
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker",
+               "--batch-size", str(args.batch_size), "--duration", str(args.duration)]
+        procs.append(subprocess.Popen(cmd, cwd=SERVICE_DIR, env=env, text=True,
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE))
+    try:
+        workers_cpu = [_read_marked(p)["cpu"] for p in procs]
+        for p in procs:  # all loaded and warm: start together
+            p.stdin.write("go\n")
+            p.stdin.flush()
+        reports = [_read_marked(p) for p in procs]
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.stdin.close()
+                p.wait(timeout=60)
+
+    latencies = [ms for r in reports for ms in r["latencies_ms"]]
+    throughput = sum(len(r["latencies_ms"]) * args.batch_size / r["elapsed_s"] for r in reports)
+    return {
+        "workers": workers,
+        "intra_op_threads": intra,
+        "inter_op_threads": inter,
+        "inference_workers": callers,
+        "pinned": pinned,
+        "calls": len(latencies),
+        "images_per_s": throughput,
+        "latency": percentiles(latencies),
+        "worker_cpus": [c.get("cpus") for c in workers_cpu],
+    }
+
+
+def recommend(results, target_p95_ms):
+    meeting = [r for r in results if r["latency"]["p95_ms"] <= target_p95_ms]
+    if meeting:
+        return max(meeting, key=lambda r: r["images_per_s"]), True
+    return min(results, key=lambda r: r["latency"]["p95_ms"]), False
+
+
+def main():
+    ncpu = len(cpu_config.available_cpus())
+    parser = argparse.ArgumentParser(description="Sweep worker/thread/affinity settings for the ensemble on this machine")
+    parser.add_argument("--models", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--target-p95-ms", type=float, default=1000.0, help="p95 latency budget per call")
+    parser.add_argument("--workers", type=_ints, default=_powers_of_two(ncpu), help="worker process counts to try")
+    parser.add_argument("--intra", type=_ints, default=_powers_of_two(ncpu), help="intra-op thread counts to try")
+    parser.add_argument("--inter", type=_ints, default=[1], help="inter-op thread counts to try")
+    parser.add_argument("--inference-workers", type=_ints,
+                        default=sorted({1, int(os.environ.get("INFERENCE_WORKERS", "2"))}),
+                        help="INFERENCE_WORKERS values to try (concurrent inference threads per process)")
+    parser.add_argument("--affinity", default="on,off", help="'on', 'off' or 'on,off'")
+    parser.add_argument("--oversubscribe", type=float, default=1.0,
+                        help="skip candidates with workers x intra-op threads above this many times the CPU count")
+    parser.add_argument("--batch-size", type=int, default=1, help="images per call (the micro-batch size)")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per candidate")
+    parser.add_argument("--output", help="result JSON (default: benchmarks/results/autotune-<timestamp>.json)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    with weights_dir_or_random(args.models) as models_dir:
+        pin_modes = [m.strip() == "on" for m in args.affinity.split(",") if m.strip()]
+        candidates = [
+            (w, t, i, c, pinned)
+            for w in args.workers for t in args.intra for i in args.inter for c in args.inference_workers for pinned in pin_modes
+            if w * t <= ncpu * args.oversubscribe and not (pinned and w == 1)  # one pinned worker gets every CPU anyway
+        ]
+        print(f"{len(candidates)} candidates on {ncpu} CPUs, {args.duration:.0f}s each, batch size {args.batch_size}")
+
+        results = []
+        print(f"{'workers':>8}{'intra':>7}{'inter':>7}{'callers':>9}{'pinned':>8}{'img/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for w, t, i, c, pinned in candidates:
+            try:
+                r = run_candidate(w, t, i, c, pinned, args, models_dir)
+            except Exception as e:
+                print(f"{w:>8}{t:>7}{i:>7}{c:>9}{str(pinned):>8}  failed: {e}")
+                continue
+            results.append(r)
+            print(f"{w:>8}{t:>7}{i:>7}{c:>9}{str(pinned):>8}{r['images_per_s']:>9.2f}"
+                  f"{r['latency']['p50_ms']:>9.1f}{r['latency']['p95_ms']:>9.1f}")
+        if not results:
+            raise SystemExit("Error: every candidate failed")
+
+        best, meets_target = recommend(results, args.target_p95_ms)
+        if meets_target:
+            print(f"\nBest throughput with p95 <= {args.target_p95_ms:.0f}ms: "
+                  f"{best['images_per_s']:.2f} img/s (p95 {best['latency']['p95_ms']:.1f}ms)")
+        else:
+            print(f"\nNo candidate meets p95 <= {args.target_p95_ms:.0f}ms; lowest p95 is "
+                  f"{best['latency']['p95_ms']:.1f}ms (try a smaller --batch-size or a higher target)")
+        env = (f"TORCH_INTRA_OP_THREADS={best['intra_op_threads']} TORCH_INTER_OP_THREADS={best['inter_op_threads']} "
+               f"INFERENCE_WORKERS={best['inference_workers']}")
+        if best["pinned"]:
+            env += " CPU_AFFINITY=auto"
+        print(f"  {env} python serve.py --workers {best['workers']}")
+
+        result = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": {"platform": platform.platform(), "cpus": ncpu, "python": platform.python_version(),
+                     "torch": core.torch.__version__},
+            "config": {k: v for k, v in vars(args).items() if k != "worker"},
+            "results": results,
+            "recommended": best,
+            "meets_target": meets_target,
+        }
+        output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                             "autotune-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
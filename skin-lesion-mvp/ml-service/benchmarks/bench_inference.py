@@ -0,0 +1,303 @@
+# benchmarks/bench_inference.py
+"""
+Reproducible inference benchmark for app.predict / server.predict.
+
+    python benchmarks/bench_inference.py                       # full suite
+    python benchmarks/bench_inference.py --no-http --batch-sizes 1,8 --threads 1,4
+    python benchmarks/bench_inference.py --compare benchmarks/results/<previous>.json
+
+Measures, on the bundled cancer_images/ plus synthetic images of several
+resolutions (randomly initialised weights are used when none are found):
+  - decode + preprocess latency per input resolution
+  - per-backbone, ensemble and fused-ensemble forward latency percentiles (batch 1)
+  - images/sec of the ensemble at each batch size x torch thread count
+  - peak RSS of the benchmark process
+  - end-to-end HTTP throughput/latency against a locally launched server.py
+Results are written as JSON (default: benchmarks/results/<timestamp>.json).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+
+from common import (DEFAULT_MODELS_DIR, SERVICE_DIR, core, percentiles, reference_images,
+                    weights_dir_or_random)
+
+torch = core.torch
+
+
+def _ints(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def bench_preprocess(images, repeat):
+    out = {}
+    for name, img in images:
+        encoded = io.BytesIO()
+        img.save(encoded, format="JPEG", quality=90)
+        data = encoded.getvalue()
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            core.images_to_tensor([data], "cpu")
+            samples.append((time.perf_counter() - t0) * 1000.0)
+        out[f"{name} ({img.size[0]}x{img.size[1]})"] = percentiles(samples)
+    return out
+
+
+def bench_backbones(loaded_models, device, repeat):
+    x = torch.randn(1, 3, 224, 224, device=device)
+    out = {}
+    with torch.no_grad():
+        for name, model in loaded_models.items():
+            model(x)  # warm-up
+            samples = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                model(x)
+                samples.append((time.perf_counter() - t0) * 1000.0)
+            out[name] = percentiles(samples)
+    samples = []
+    core.predict_tensor(x, loaded_models)
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        core.predict_tensor(x, loaded_models)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    out["ensemble"] = percentiles(samples)
+
+    # same ensemble as one TorchScript module (FUSED_ENSEMBLE=script); takes unnormalized input
+    fused = core.fuse_models(loaded_models, device)
+    raw = torch.rand(1, 3, 224, 224, device=device)
+    for _ in range(2):
+        core.predict_fused(raw, fused)  # warm-up (TorchScript profiles the first calls)
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        core.predict_fused(raw, fused)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    out["ensemble_fused"] = percentiles(samples)
+    return out
+
+
+def bench_throughput(loaded_models, device, batch_sizes, thread_counts, repeat):
+    out = []
+    original = torch.get_num_threads()
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            for bs in batch_sizes:
+                x = torch.randn(bs, 3, 224, 224, device=device)
+                core.predict_tensor(x, loaded_models)  # warm-up
+                t0 = time.perf_counter()
+                for _ in range(repeat):
+                    core.predict_tensor(x, loaded_models)
+                elapsed = time.perf_counter() - t0
+                row = {"threads": threads, "batch_size": bs,
+                       "images_per_s": bs * repeat / elapsed, "ms_per_batch": 1000.0 * elapsed / repeat}
+                print(f"  threads={threads:<3} batch={bs:<4} {row['images_per_s']:8.1f} img/s  {row['ms_per_batch']:8.1f} ms/batch")
+                out.append(row)
+    finally:
+        torch.set_num_threads(original)
+    return out
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def bench_http(models_dir, images, requests_total, concurrency, server_env):
+    port = _free_port()
+    env = dict(os.environ, MODELS_DIR=models_dir, **server_env)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 300
+        while True:
+            try:
+                with urllib.request.urlopen(f"{base}/ready", timeout=2) as r:
+                    if r.status == 200:
+                        break
+            except Exception:
+                pass
+            if time.time() > deadline or proc.poll() is not None:
+                raise RuntimeError("server did not become ready")
+            time.sleep(0.5)
+
+        payloads = []
+        for i, (name, img) in enumerate(images):
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=90)
+            payloads.append(_multipart("file", f"{i}.jpg", buf.getvalue()))
+
+        latencies, errors, lock = [], [0], threading.Lock()
+        counter = iter(range(requests_total))
+
+        def client():
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                body, ctype = payloads[i % len(payloads)]
+                req = urllib.request.Request(f"{base}/predict", data=body, headers={"Content-Type": ctype})
+                t0 = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(req, timeout=120) as r:
+                        r.read()
+                    with lock:
+                        latencies.append((time.perf_counter() - t0) * 1000.0)
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+
+        t0 = time.perf_counter()
+        workers = [threading.Thread(target=client) for _ in range(concurrency)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - t0
+        return {
+            "requests": requests_total,
+            "concurrency": concurrency,
+            "errors": errors[0],
+            "requests_per_s": len(latencies) / elapsed,
+            "latency": percentiles(latencies) if latencies else None,
+            "server_env": server_env,
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+def _compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+
+    def row(label, old, new, higher_is_better=False):
+        if old is None or new is None:
+            return
+        change = (new - old) / old * 100.0 if old else 0.0
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {label:<44}{old:>10.1f}{new:>10.1f}{change:>+9.1f}% {'better' if better else 'worse'}")
+
+    print(f"\nComparison with {previous_path} ({previous.get('git_rev')} -> {current.get('git_rev')})")
+    for name, r in current["latency_ms"].items():
+        old = previous.get("latency_ms", {}).get(name)
+        if old:
+            row(f"{name} p50 ms", old["p50_ms"], r["p50_ms"])
+            row(f"{name} p95 ms", old["p95_ms"], r["p95_ms"])
+    old_tp = {(r["threads"], r["batch_size"]): r["images_per_s"] for r in previous.get("throughput", [])}
+    for r in current["throughput"]:
+        row(f"img/s threads={r['threads']} batch={r['batch_size']}", old_tp.get((r["threads"], r["batch_size"])),
+            r["images_per_s"], higher_is_better=True)
+    if current.get("http") and previous.get("http"):
+        row("http requests/s", previous["http"]["requests_per_s"], current["http"]["requests_per_s"], higher_is_better=True)
+    row("peak RSS MB", previous.get("peak_rss_mb"), current.get("peak_rss_mb"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference latency/throughput benchmark for the ML service")
+    parser.add_argument("--models", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--batch-sizes", type=_ints, default=[1, 4, 8, 16])
+    parser.add_argument("--threads", type=_ints, default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--synthetic-sizes", type=_ints, default=[512, 1024, 2048, 4032])
+    parser.add_argument("--no-http", action="store_true", help="skip the end-to-end HTTP benchmark")
+    parser.add_argument("--http-requests", type=int, default=40)
+    parser.add_argument("--http-concurrency", type=int, default=4)
+    parser.add_argument("--output", help="result JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous result JSON to diff against")
+    args = parser.parse_args()
+
+    with weights_dir_or_random(args.models) as models_dir:
+        loaded_models, device = core.load_models(models_dir)
+        images = reference_images(synthetic_sizes=args.synthetic_sizes)
+
+        result = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_rev": _git_rev(),
+            "host": {"platform": platform.platform(), "cpu_count": os.cpu_count(), "python": platform.python_version(),
+                     "torch": torch.__version__, "torch_threads": torch.get_num_threads()},
+            "models": list(loaded_models),
+            "random_weights": models_dir != core.resolve_models_dir(args.models),
+        }
+
+        print("\nDecode + preprocess (ms)")
+        result["preprocess_ms"] = bench_preprocess(images, args.repeat)
+        for name, r in result["preprocess_ms"].items():
+            print(f"  {name:<40} p50 {r['p50_ms']:7.1f}  p95 {r['p95_ms']:7.1f}")
+
+        print("\nForward latency, batch 1 (ms)")
+        result["latency_ms"] = bench_backbones(loaded_models, device, args.repeat)
+        for name, r in result["latency_ms"].items():
+            print(f"  {name:<14} p50 {r['p50_ms']:7.1f}  p95 {r['p95_ms']:7.1f}  p99 {r['p99_ms']:7.1f}")
+
+        print("\nEnsemble throughput")
+        result["throughput"] = bench_throughput(loaded_models, device, args.batch_sizes, args.threads, max(1, args.repeat // 2))
+        result["peak_rss_mb"] = _peak_rss_mb()
+        print(f"\nPeak RSS: {result['peak_rss_mb']:.0f} MB")
+
+        if not args.no_http:
+            del loaded_models
+            print(f"\nHTTP: {args.http_requests} requests, concurrency {args.http_concurrency}")
+            # the sample set repeats, so keep the prediction cache out of the measurement
+            result["http"] = bench_http(models_dir, images, args.http_requests, args.http_concurrency,
+                                        server_env={"PREDICTION_CACHE_MAX_ENTRIES": "0"})
+            h = result["http"]
+            if h["latency"]:
+                print(f"  {h['requests_per_s']:.2f} req/s  p50 {h['latency']['p50_ms']:.0f} ms  "
+                      f"p95 {h['latency']['p95_ms']:.0f} ms  errors {h['errors']}")
+
+        output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                             time.strftime("%Y%m%d-%H%M%S") + ".json")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults saved to {output}")
+
+        if args.compare:
+            _compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_preprocess.py
+"""
+Per-request latency of the old temp-file JPEG round trip vs. the in-memory path.
+
+    python benchmarks/bench_preprocess.py [--models DIR] [--repeat 10] [--size 3024]
+
+Uses randomly initialised backbones when no weight files are found, so it can
+run anywhere. Also reports how far the lossy JPEG re-encode moved the
+ensemble probabilities.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import DEFAULT_MODELS_DIR, core, load_or_random, percentiles, reference_images
+
+
+def _legacy_predict_image(image, loaded_models, device):
+    """The pre-change predict_image: re-encode to a temp JPEG, then re-open from disk."""
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
+            image.convert("RGB").save(tmp.name, format="JPEG", quality=95)
+            tmp_path = tmp.name
+        return core.predict(tmp_path, loaded_models, device)
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+def _time(fn, images, repeat):
+    samples = []
+    for _ in range(repeat):
+        for img in images:
+            t0 = time.perf_counter()
+            fn(img)
+            samples.append((time.perf_counter() - t0) * 1000.0)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark temp-file vs in-memory preprocessing")
+    parser.add_argument("--models", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--size", type=int, default=3024, help="width of the synthetic phone-sized photo")
+    args = parser.parse_args()
+
+    loaded_models, device = load_or_random(args.models)
+    images = [img for _, img in reference_images(synthetic_sizes=(args.size,))]
+
+    legacy = lambda img: _legacy_predict_image(img, loaded_models, device)
+    in_memory = lambda img: core.predict_batch([img], loaded_models, device)[0]
+
+    # warm-up
+    for img in images:
+        legacy(img)
+        in_memory(img)
+
+    drift = max(
+        max(abs(a - b) for a, b in zip(legacy(img)["class_probabilities"].values(),
+                                        in_memory(img)["class_probabilities"].values()))
+        for img in images
+    )
+
+    before = _time(legacy, images, args.repeat)
+    after = _time(in_memory, images, args.repeat)
+
+    print(f"\n{'path':<12}{'mean':>10}{'p50':>10}{'p95':>10}  (ms per request, {len(images)} images x {args.repeat})")
+    for name, r in (("temp-file", before), ("in-memory", after)):
+        print(f"{name:<12}{r['mean_ms']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}")
+    print(f"speedup (mean): {before['mean_ms'] / after['mean_ms']:.2f}x")
+    print(f"max |Δ class probability| caused by the JPEG re-encode: {drift:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# benchmarks/bench_startup.py
+"""
+Startup cost of the service and the CLI, each measured in fresh processes.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--no-server] [--no-cli]
+
+  - `import app`, `import server`, and torch + torchvision on their own (what app defers to first use)
+  - server.py under uvicorn: seconds until /health answers, and until /ready (models loaded and warm)
+  - the CLI: a one-shot `app.py -f IMAGE --no-daemon` vs. the same call answered by `app.py --daemon`
+Wall-clock medians; `python -c pass` is reported so interpreter startup can be subtracted.
+Results are written as JSON (default: benchmarks/results/startup-<timestamp>.json).
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from common import DEFAULT_MODELS_DIR, SERVICE_DIR, SAMPLE_DIR, list_images, weights_dir_or_random
+
+APP = os.path.join(SERVICE_DIR, "app.py")
+
+
+def _wall(cmd, repeat, env=None, cwd=None):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd or SERVICE_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - t0)
+    return {"median_s": statistics.median(samples), "min_s": min(samples), "runs": repeat}
+
+
+def bench_imports(repeat):
+    py = sys.executable
+    return {
+        "python -c pass": _wall([py, "-c", "pass"], repeat),
+        "import app": _wall([py, "-c", "import app"], repeat),
+        "import server": _wall([py, "-c", "import server"], repeat),
+        "import torch, torchvision": _wall([py, "-c", "import torch, torchvision.models, torchvision.transforms"], repeat),
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, proc, started, deadline_s=300):
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as r:
+                if r.status == 200:
+                    return time.perf_counter() - started
+        except Exception:
+            pass
+        if time.perf_counter() - started > deadline_s or proc.poll() is not None:
+            raise RuntimeError(f"{url} did not answer")
+        time.sleep(0.02)
+
+
+def bench_server(models_dir, repeat):
+    health, ready = [], []
+    for _ in range(repeat):
+        port = _free_port()
+        env = dict(os.environ, MODELS_DIR=models_dir, JOB_WORKERS="0")
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            health.append(_wait_for(f"http://127.0.0.1:{port}/health", proc, started))
+            ready.append(_wait_for(f"http://127.0.0.1:{port}/ready", proc, started))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    return {"health_s": statistics.median(health), "ready_s": statistics.median(ready), "runs": repeat}
+
+
+def bench_cli(models_dir, image, repeat):
+    cmd = [sys.executable, APP, "-f", image, "--models", models_dir]
+    with tempfile.TemporaryDirectory() as tmp:  # the CLI writes <image>_prediction.json to the cwd
+        sock = os.path.join(tmp, "daemon.sock")
+        out = {"one_shot": _wall(cmd + ["--no-daemon"], repeat, cwd=tmp)}
+
+        daemon = subprocess.Popen([sys.executable, APP, "--daemon", "--models", models_dir, "--socket", sock],
+                                  cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            started = time.perf_counter()
+            while not os.path.exists(sock):
+                if daemon.poll() is not None or time.perf_counter() - started > 300:
+                    raise RuntimeError("CLI daemon did not start")
+                time.sleep(0.05)
+            out["daemon_start_s"] = time.perf_counter() - started
+            out["via_daemon"] = _wall(cmd + ["--socket", sock], repeat, cwd=tmp)
+        finally:
+            subprocess.run([sys.executable, APP, "--stop-daemon", "--socket", sock], cwd=tmp,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            daemon.wait(timeout=30)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import and startup times of server.py and the app.py CLI")
+    parser.add_argument("--models", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-server", action="store_true", help="skip the uvicorn /health + /ready timing")
+    parser.add_argument("--no-cli", action="store_true", help="skip the CLI one-shot vs. daemon timing")
+    parser.add_argument("--output", help="result JSON (default: benchmarks/results/startup-<timestamp>.json)")
+    args = parser.parse_args()
+
+    with weights_dir_or_random(args.models) as models_dir:
+        result = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": {"platform": platform.platform(), "cpu_count": os.cpu_count(), "python": platform.python_version()},
+            "imports": bench_imports(args.repeat),
+        }
+        print("Import (fresh process, median)")
+        for name, r in result["imports"].items():
+            print(f"  {name:<28}{r['median_s']:>8.2f}s")
+
+        if not args.no_server:
+            result["server"] = bench_server(models_dir, max(1, args.repeat // 2))
+            print(f"server.py: /health after {result['server']['health_s']:.2f}s, /ready after {result['server']['ready_s']:.2f}s")
+
+        if not args.no_cli:
+            result["cli"] = bench_cli(models_dir, list_images(SAMPLE_DIR)[0], args.repeat)
+            cli = result["cli"]
+            print(f"CLI: one-shot {cli['one_shot']['median_s']:.2f}s, via daemon {cli['via_daemon']['median_s']:.2f}s "
+                  f"(daemon start {cli['daemon_start_s']:.2f}s)")
+
+        output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                             "startup-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/cascade_report.py
+"""
+Offline report for the cascade mode: compute saved vs. agreement with the full ensemble.
+
+    python benchmarks/cascade_report.py [--images DIR] [--confidence 0.7,0.85,0.95] [--margin 0.3,0.5] [--json out.json]
+
+Every backbone runs once per image; each (confidence, margin) threshold pair is
+then simulated on those outputs. Compute saved is estimated from the measured
+per-backbone forward time: images that do not escalate only pay for the cheap
+backbone.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from common import DEFAULT_MODELS_DIR, core, load_or_random, reference_images
+
+torch = core.torch
+
+
+def _floats(text):
+    return [float(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate cascade thresholds against the full ensemble")
+    parser.add_argument("--models", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--images", help="extra directory of reference images")
+    parser.add_argument("--cheap-model", default="mobilenetv3")
+    parser.add_argument("--confidence", type=_floats, default=[0.6, 0.7, 0.8, 0.85, 0.9, 0.95])
+    parser.add_argument("--margin", type=_floats, default=[0.0, 0.3, 0.5])
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    loaded_models, device = load_or_random(args.models)
+    if args.cheap_model not in loaded_models:
+        raise SystemExit(f"Error: cheap model {args.cheap_model} is not loaded")
+    images = reference_images(args.images)
+    print(f"{len(images)} reference images")
+
+    # per-backbone probabilities and forward cost (ms per image, batch 1)
+    probs = {name: [] for name in loaded_models}
+    cost = {name: 0.0 for name in loaded_models}
+    with torch.no_grad():
+        for _, img in images:
+            x = core.images_to_tensor([img], device)
+            for name, model in loaded_models.items():
+                t0 = time.perf_counter()
+                out = torch.softmax(model(x), dim=1)[0].cpu().numpy()
+                cost[name] += (time.perf_counter() - t0) * 1000.0
+                probs[name].append(out)
+    probs = {name: np.stack(p) for name, p in probs.items()}
+    cost = {name: c / len(images) for name, c in cost.items()}
+
+    full = np.mean([p for p in probs.values()], axis=0)
+    full_top = full.argmax(axis=1)
+    malignant_ids = [i for i, n in core.CLASS_NAMES.items() if n in core.MALIGNANT_CLASSES]
+    full_malignant = np.isin(full_top, malignant_ids)
+    full_cost = sum(cost.values())
+    cheap_cost = cost[args.cheap_model]
+
+    rows = []
+    for min_conf in args.confidence:
+        for min_margin in args.margin:
+            escalate = core.cascade_escalate(probs[args.cheap_model], min_conf, min_margin)
+            cascade_probs = np.where(escalate[:, None], full, probs[args.cheap_model])
+            top = cascade_probs.argmax(axis=1)
+            rows.append({
+                "min_confidence": min_conf,
+                "min_margin": min_margin,
+                "escalated": float(escalate.mean()),
+                "compute_saved": 1.0 - (cheap_cost + escalate.mean() * (full_cost - cheap_cost)) / full_cost,
+                "top1_agreement": float((top == full_top).mean()),
+                "malignant_agreement": float((np.isin(top, malignant_ids) == full_malignant).mean()),
+                "max_abs_diff": float(np.abs(cascade_probs - full).max()),
+            })
+
+    print("\nPer-image forward cost (ms): " + ", ".join(f"{n} {c:.1f}" for n, c in cost.items()))
+    print(f"\n{'conf':>6}{'margin':>8}{'escalated':>11}{'saved':>8}{'top-1 agr':>11}{'malig agr':>11}{'max Δp':>9}")
+    for r in rows:
+        print(f"{r['min_confidence']:>6.2f}{r['min_margin']:>8.2f}{r['escalated']:>11.1%}{r['compute_saved']:>8.1%}"
+              f"{r['top1_agreement']:>11.1%}{r['malignant_agreement']:>11.1%}{r['max_abs_diff']:>9.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": [n for n, _ in images], "forward_cost_ms": cost, "thresholds": rows}, f, indent=2)
+        print(f"\nReport saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
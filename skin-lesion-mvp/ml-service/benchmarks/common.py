@@ -0,0 +1,80 @@
+# benchmarks/common.py
+"""Shared helpers for the benchmark / report scripts in this directory."""
+import glob
+import os
+import statistics
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(HERE)
+sys.path.insert(0, SERVICE_DIR)
+
+import app as core  # noqa: E402
+
+DEFAULT_MODELS_DIR = os.environ.get("MODELS_DIR", os.path.join(SERVICE_DIR, "models"))
+SAMPLE_DIR = os.path.join(SERVICE_DIR, "cancer_images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_or_random(models_dir):
+    """Load the real weights, or randomly initialised backbones when none are found."""
+    loaded_models, device = core.load_models(models_dir)
+    if loaded_models:
+        return loaded_models, device
+    print("No weights found; using randomly initialised backbones")
+    device = core.torch.device("cpu")
+    loaded_models = {name: core.build_model(name).eval() for name in core.MODEL_FILENAMES}
+    return loaded_models, device
+
+
+@contextmanager
+def weights_dir_or_random(models_dir):
+    """Yields models_dir if it has weight files, else a temp dir of randomly initialised checkpoints (removed on exit)."""
+    resolved = core.resolve_models_dir(models_dir)
+    if core.find_model_files(resolved):
+        yield resolved
+        return
+    with tempfile.TemporaryDirectory(prefix="healthaware-random-weights-") as tmp:
+        print(f"No weights found; writing randomly initialised checkpoints to {tmp}")
+        for name, filenames in core.MODEL_FILENAMES.items():
+            core.torch.save(core.build_model(name).state_dict(), os.path.join(tmp, filenames[0]))
+        yield tmp
+
+
+def list_images(directory):
+    return sorted(
+        p for p in glob.glob(os.path.join(directory, "*"))
+        if p.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def reference_images(extra_dir=None, synthetic_sizes=()):
+    """Bundled sample images (+ optional directory) plus synthetic noise images of the given widths."""
+    paths = list_images(SAMPLE_DIR) + (list_images(extra_dir) if extra_dir else [])
+    images = []
+    for p in paths:
+        try:
+            images.append((os.path.basename(p), Image.open(p).convert("RGB")))
+        except OSError as e:
+            print(f"Skipping {p}: {e}")
+    rng = np.random.default_rng(0)
+    for width in synthetic_sizes:
+        height = width * 3 // 4
+        images.append((f"synthetic_{width}x{height}", Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))))
+    return images
+
+
+def percentiles(samples_ms):
+    samples = sorted(samples_ms)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))]
+    return {
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+    }
@@ -0,0 +1,81 @@
+# benchmarks/precision_report.py
+"""
+Accuracy drift and latency of reduced-precision ensembles vs. fp32.
+
+    python benchmarks/precision_report.py --spec int8 --spec bf16 \
+        --spec "resnet50=int8,densenet121=bf16+channels_last" [--images DIR] [--json out.json]
+
+Each --spec uses the MODEL_PRECISION syntax. For every reference image the
+ensemble `class_probabilities` of the variant are compared against fp32:
+max / mean absolute difference, top-1 agreement and per-image latency.
+"""
+import argparse
+import copy
+import json
+import time
+
+from common import DEFAULT_MODELS_DIR, core, load_or_random, percentiles, reference_images
+
+
+def _run(loaded_models, device, images, repeat):
+    results, samples = [], []
+    for _, img in images:
+        for i in range(repeat + 1):
+            t0 = time.perf_counter()
+            res = core.predict_batch([img], loaded_models, device)[0]
+            if i:  # first call is warm-up
+                samples.append((time.perf_counter() - t0) * 1000.0)
+        results.append(res)
+    return results, percentiles(samples)
+
+
+def _drift(reference, candidate):
+    diffs, agree = [], 0
+    for ref, cand in zip(reference, candidate):
+        ref_p, cand_p = ref["class_probabilities"], cand["class_probabilities"]
+        diffs.append(max(abs(ref_p[k] - cand_p[k]) for k in ref_p))
+        agree += ref["prediction"]["class_name"] == cand["prediction"]["class_name"]
+    return {
+        "max_abs_diff": max(diffs),
+        "mean_max_abs_diff": sum(diffs) / len(diffs),
+        "top1_agreement": agree / len(reference),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reduced-precision ensembles against fp32")
+    parser.add_argument("--models", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--images", help="extra directory of reference images")
+    parser.add_argument("--spec", action="append", default=[], help="MODEL_PRECISION spec to evaluate (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    specs = args.spec or ["int8", "bf16", "fp32+channels_last"]
+    fp32_models, device = load_or_random(args.models)
+    images = reference_images(args.images)
+    print(f"{len(images)} reference images")
+
+    reference, fp32_latency = _run(fp32_models, device, images, args.repeat)
+    report = {"images": [name for name, _ in images], "fp32": {"latency": fp32_latency}, "variants": {}}
+
+    for spec in specs:
+        # a fresh fp32 set per spec, so no variant can leak conversions into the next one's baseline
+        variant = core.apply_precision(copy.deepcopy(fp32_models), spec)
+        results, latency = _run(variant, device, images, args.repeat)
+        report["variants"][spec] = {"latency": latency, **_drift(reference, results)}
+
+    print(f"\n{'mode':<48}{'mean ms':>10}{'p95 ms':>10}{'max Δp':>10}{'top-1 agr':>11}")
+    print(f"{'fp32':<48}{fp32_latency['mean_ms']:>10.1f}{fp32_latency['p95_ms']:>10.1f}{0:>10.4f}{1:>11.2%}")
+    for spec, r in report["variants"].items():
+        print(f"{spec:<48}{r['latency']['mean_ms']:>10.1f}{r['latency']['p95_ms']:>10.1f}"
+              f"{r['max_abs_diff']:>10.4f}{r['top1_agreement']:>11.2%}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# bulk_score.py
+"""
+Offline bulk scoring for large image archives.
+
+    python bulk_score.py /data/archive -o scores.jsonl
+    python bulk_score.py "/data/**/*.jpg" -o scores.csv --batch-size 32 --decode-workers 8
+    python bulk_score.py manifest.txt -o scores.jsonl      # .txt / .csv / .jsonl list of paths
+
+Images are streamed: a thread pool decodes and resizes a bounded window of
+files ahead of the model, batches of tensors go through one ensemble pass, and
+every batch is appended to the output (JSONL or CSV) and flushed. Re-running
+with the same output skips paths that are already scored in it, so an
+interrupted run resumes where it stopped (paths are recorded absolute, so a
+resume from another directory or via another relative spelling still matches). Paths whose row is an error (decode
+or IO failures are often transient) are tried again and get a new row; the
+last row for a path is the current one. --no-retry-errors skips them too.
+"""
+import argparse
+import csv
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import app as core
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+CSV_FIELDS = ["path", "class_name", "display_name", "risk", "confidence", "agreement", "error"] + [
+    f"prob_{name}" for name in core.CLASS_NAMES.values()
+]
+
+
+def iter_inputs(source):
+    """Yield image paths from a directory (recursive), a glob pattern or a manifest file."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+    elif any(ch in source for ch in "*?["):
+        for path in glob.iglob(source, recursive=True):
+            if os.path.isfile(path):
+                yield path
+    elif os.path.isfile(source):
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, newline="") as f:
+            if source.endswith(".jsonl"):
+                paths = (json.loads(line)["path"] for line in f if line.strip())
+            elif source.endswith(".csv"):
+                reader = csv.reader(f)
+                header = next(reader, [])
+                if "path" in header:
+                    col = header.index("path")
+                    paths = (row[col] for row in reader if row)
+                else:
+                    # no header row: first column holds the paths
+                    paths = (row[0] for row in itertools.chain([header], reader) if row)
+            else:
+                paths = (line.strip() for line in f if line.strip() and not line.startswith("#"))
+            for path in paths:
+                yield path if os.path.isabs(path) else os.path.join(base, path)
+    else:
+        raise SystemExit(f"Error: {source} is not a directory, glob or manifest file")
+
+
+def already_scored(output, fmt, retry_errors=True):
+    """Paths present in an existing output file (for resume); with retry_errors, only those with a prediction."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, newline="") as f:
+        if fmt == "csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    pass  # truncated last line from an interrupted run
+        for row in rows:
+            if "path" not in row:
+                continue
+            scored = bool(row.get("class_name")) if fmt == "csv" else "prediction" in row
+            if scored or not retry_errors:
+                done.add(os.path.abspath(row["path"]))  # rows from older runs may hold relative paths
+    return done
+
+
+def _decode(path):
+    try:
+        return path, core.images_to_tensor([path], "cpu")[0], None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def _decoded_stream(paths, workers, window):
+    """Decode ahead of the consumer with at most `window` images in flight."""
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        pending = deque()
+        for path in paths:
+            pending.append(ex.submit(_decode, path))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _batches(stream, size):
+    batch = []
+    for item in stream:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _Writer:
+    def __init__(self, output, fmt):
+        self.fmt = fmt
+        new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+        self.f = open(output, "a", newline="")
+        self.csv = None
+        if fmt == "csv":
+            self.csv = csv.DictWriter(self.f, fieldnames=CSV_FIELDS)
+            if new_file:
+                self.csv.writeheader()
+
+    def write(self, path, result=None, error=None):
+        if self.fmt == "csv":
+            row = {"path": path, "error": error or ""}
+            if result:
+                pred = result["prediction"]
+                row.update({k: pred[k] for k in ("class_name", "display_name", "risk", "confidence", "agreement")})
+                row.update({f"prob_{k}": v for k, v in result["class_probabilities"].items()})
+            self.csv.writerow(row)
+        else:
+            record = {"path": path, **result} if result else {"path": path, "error": error}
+            self.f.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a directory, glob or manifest of images in bulk")
+    parser.add_argument("input", help="directory, glob pattern (quote it) or manifest (.txt/.csv/.jsonl)")
+    parser.add_argument("-o", "--output", required=True, help="results file (.jsonl or .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="output format (default: from extension)")
+    parser.add_argument("--models", type=str, help="Path to the models directory (default: MODELS_DIR or ./models)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--decode-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--retry-errors", action=argparse.BooleanOptionalAction, default=True,
+                        help="on resume, score again the paths whose earlier row is an error (default: on)")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+    if args.models:
+        os.environ["MODELS_DIR"] = args.models
+    model_set = core._ensure_loaded()
+    if model_set.models is None:
+        print("Error: Could not load any models. Exiting.")
+        sys.exit(1)
+
+    done = already_scored(args.output, fmt, args.retry_errors)
+    if done:
+        print(f"Resuming: {len(done)} images already in {args.output}")
+    todo = (os.path.abspath(p) for p in iter_inputs(args.input))
+    todo = (p for p in todo if p not in done)
+
+    writer = _Writer(args.output, fmt)
+    scored = failed = 0
+    started = time.perf_counter()
+    try:
+        stream = _decoded_stream(todo, args.decode_workers, window=args.batch_size * 4)
+        for batch in _batches(stream, args.batch_size):
+            ok = [(path, tensor) for path, tensor, err in batch if tensor is not None]
+            for path, _, err in batch:
+                if err is not None:
+                    writer.write(path, error=err)
+                    failed += 1
+            if ok:
+                tensors = core.torch.stack([t for _, t in ok]).to(model_set.device)
+                results = core.predict_tensor(tensors, model_set.models)
+                if core._TTA:
+                    core.apply_tta(tensors, results, model_set.models, core._TTA)
+                for (path, _), result in zip(ok, results):
+                    writer.write(path, result=result)
+                scored += len(ok)
+            writer.flush()
+
+            elapsed = time.perf_counter() - started
+            print(f"\r{scored} scored, {failed} failed, {scored / max(elapsed, 1e-9):.1f} img/s", end="", flush=True)
+    finally:
+        writer.close()
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# cache.py
+"""
+Content-addressed prediction cache.
+
+Results are keyed on a hash of the decoded pixels (so re-uploads of the same
+photo hit even if the encoding or filename differs) and stored as JSON text,
+which keeps the memory bound honest and hands every hit a fresh copy. The
+cache is tied to one model-set version and empties itself when it changes.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+
+def image_key(image: Image.Image) -> str:
+    """Stable digest of the decoded pixel data."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl_s: float = 3600.0):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl_s = float(ttl_s)
+
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, payload)
+        self._bytes = 0
+        self._version: Optional[str] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def _check_version(self, version: str):
+        if version != self._version:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self._bytes = 0
+            self._version = version
+
+    def _drop(self, key: str):
+        _, payload = self._data.pop(key)
+        self._bytes -= len(payload)
+
+    def get(self, key: str, version: str) -> Optional[Any]:
+        with self._lock:
+            self._check_version(version)
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, payload = entry
+            if self.ttl_s > 0 and time.monotonic() > expires_at:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+        return json.loads(payload)
+
+    def put(self, key: str, version: str, value: Any):
+        if not self.enabled:
+            return
+        payload = json.dumps(value)
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl_s, payload)
+            self._bytes += len(payload)
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "version": self._version,
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
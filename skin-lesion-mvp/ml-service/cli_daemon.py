@@ -0,0 +1,107 @@
+# cli_daemon.py
+"""
+Local daemon that keeps the CLI's models loaded between invocations.
+
+    python app.py --daemon &            # load the models once, listen on a Unix socket
+    python app.py -f lesion.jpg         # sent to the daemon if one is running, else loads models itself
+    python app.py --stop-daemon
+
+One newline-terminated JSON request per connection, one JSON response back:
+    {"op": "predict", "path": "/abs/lesion.jpg", "models_dir": "/abs/models"}
+    {"op": "ping"}  |  {"op": "shutdown"}
+The socket lives in $XDG_RUNTIME_DIR (else the temp dir), is named per user
+and created with mode 0600; APP_DAEMON_SOCKET overrides the path. Requests
+are handled one at a time. The daemon exits after --idle-timeout seconds
+without a request.
+"""
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import time
+from typing import Any, Callable, Dict
+
+MAX_REQUEST_BYTES = 64 * 1024
+
+
+def available() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def default_socket_path() -> str:
+    if os.environ.get("APP_DAEMON_SOCKET"):
+        return os.environ["APP_DAEMON_SOCKET"]
+    user = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"healthaware-app-{user}.sock")
+
+
+def request(payload: Dict[str, Any], socket_path: str, timeout: float = 300.0) -> Dict[str, Any]:
+    """Send one request to the daemon; raises OSError if none is listening"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(payload).encode() + b"\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        server.last_request = time.monotonic()
+        try:
+            payload = json.loads(self.rfile.readline(MAX_REQUEST_BYTES))
+            if payload.get("op") == "shutdown":
+                server.stopping = True
+                response = {"ok": True}
+            else:
+                response = server.handle_request_payload(payload)
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response).encode())
+        server.last_request = time.monotonic()
+
+
+class _Server(socketserver.UnixStreamServer):
+    timeout = 1.0  # handle_request() returns at least this often, to check idle / shutdown
+
+
+def serve(handle: Callable[[Dict[str, Any]], Dict[str, Any]], socket_path: str, idle_timeout: float = 0.0):
+    """Answer requests with handle(payload) until shut down or idle for idle_timeout seconds (0 = never)"""
+    if os.path.exists(socket_path):
+        try:
+            request({"op": "ping"}, socket_path, timeout=5.0)
+        except OSError:
+            os.unlink(socket_path)  # left behind by a daemon that died
+        else:
+            raise RuntimeError(f"a daemon is already listening on {socket_path}")
+
+    old_umask = os.umask(0o177)  # socket file 0600: only this user can send requests
+    try:
+        server = _Server(socket_path, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.handle_request_payload = handle
+    server.stopping = False
+    server.last_request = time.monotonic()
+    print(f"CLI daemon listening on {socket_path} (pid {os.getpid()})", flush=True)
+    try:
+        while not server.stopping:
+            server.handle_request()
+            if idle_timeout and time.monotonic() - server.last_request > idle_timeout:
+                print(f"No requests for {idle_timeout:.0f}s; exiting")
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
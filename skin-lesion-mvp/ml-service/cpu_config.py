@@ -0,0 +1,173 @@
+# cpu_config.py
+"""
+Thread counts and CPU affinity for the inference processes.
+
+Left alone, every process sizes torch's intra-op pool to the whole machine, so
+N uvicorn workers run N x cores compute threads that mostly preempt each
+other. configure() sets the pools explicitly and can pin each worker process
+to its own slice of the CPUs:
+
+    TORCH_INTRA_OP_THREADS  threads per op ("auto": the CPUs this process gets; 0 = torch default)
+    TORCH_INTER_OP_THREADS  threads running independent ops of a TorchScript graph (0 = torch default)
+    CPU_AFFINITY            "" (off), "auto" (split the CPUs evenly between the worker processes)
+                            or an explicit CPU list for this process, e.g. "0-3,8"
+    CPU_AFFINITY_SLOTS      processes sharing the CPUs (default SERVE_WORKERS, set by serve.py)
+
+With CPU_AFFINITY=auto a worker takes the first slot whose lock file it can
+lock; the lock goes away with the process, so a restarted worker reuses the
+slice its predecessor had. benchmarks/autotune_threads.py measures the
+combinations on the current machine.
+"""
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; slots are then not claimed
+    fcntl = None
+
+_STATE: Dict[str, Any] = {}
+_SLOT_LOCK = None  # open lock file held for the life of the process
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """'0-3,8' -> [0, 1, 2, 3, 8]"""
+    cpus = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus: List[int]) -> str:
+    """[0, 1, 2, 3, 8] -> '0-3,8'"""
+    ranges, start = [], None
+    for i, cpu in enumerate(cpus):
+        if start is None:
+            start = cpu
+        if i + 1 == len(cpus) or cpus[i + 1] != cpu + 1:
+            ranges.append(f"{start}-{cpu}" if cpu != start else str(cpu))
+            start = None
+    return ",".join(ranges)
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cpus(cpus: List[int], slots: int, slot: int) -> List[int]:
+    """Contiguous share of cpus for one of `slots` processes (shared round-robin when there are more slots than CPUs)"""
+    slots = max(1, slots)
+    if slots >= len(cpus):
+        return [cpus[slot % len(cpus)]]
+    per, extra = divmod(len(cpus), slots)
+    start = slot * per + min(slot, extra)
+    return cpus[start:start + per + (1 if slot < extra else 0)]
+
+
+def claim_slot(slots: int, lock_dir: Optional[str] = None) -> Optional[int]:
+    """Index of the first free slot in 0..slots-1, held until this process exits; None if all are taken"""
+    global _SLOT_LOCK
+    if fcntl is None:
+        return None
+    lock_dir = lock_dir or os.path.join(tempfile.gettempdir(), "healthaware-cpu-slots")
+    os.makedirs(lock_dir, exist_ok=True)
+    for slot in range(slots):
+        f = open(os.path.join(lock_dir, f"slot-{slot}.lock"), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        _SLOT_LOCK = f
+        return slot
+    return None
+
+
+def pin_process(cpus: List[int]) -> bool:
+    """Restrict every thread of this process (and threads it starts later) to cpus"""
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        tids = [int(t) for t in os.listdir("/proc/self/task")]
+    except OSError:
+        tids = [0]
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except OSError:
+            pass  # thread exited meanwhile
+    return True
+
+
+def config_from_env() -> Dict[str, Any]:
+    return {
+        "intra_op_threads": os.environ.get("TORCH_INTRA_OP_THREADS", "auto"),
+        "inter_op_threads": int(os.environ.get("TORCH_INTER_OP_THREADS", "0")),
+        "affinity": os.environ.get("CPU_AFFINITY", ""),
+        "slots": int(os.environ.get("CPU_AFFINITY_SLOTS") or os.environ.get("SERVE_WORKERS") or "1"),
+    }
+
+
+def configure(torch, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Apply thread counts and affinity once per process; returns what was applied"""
+    if _STATE.get("pid") == os.getpid():
+        return status()
+    config = config or config_from_env()
+    cpus, slot = available_cpus(), None
+    slots = max(1, int(config["slots"]))
+
+    affinity = str(config["affinity"]).strip().lower()
+    pinned = False
+    if affinity == "auto":
+        slot = claim_slot(slots) if slots > 1 else 0
+        if slot is None:
+            print(f"Warning: all {slots} CPU slots are taken; not pinning this process (raise CPU_AFFINITY_SLOTS)")
+        else:
+            cpus = split_cpus(cpus, slots, slot)
+            pinned = pin_process(cpus)
+    elif affinity not in ("", "0", "off", "false"):
+        cpus = parse_cpu_list(affinity)
+        pinned = pin_process(cpus)
+
+    intra = str(config["intra_op_threads"]).strip().lower()
+    if intra == "auto":
+        # torch's default is fine for a process that has the machine to itself
+        intra_threads = len(cpus) if pinned else (max(1, len(cpus) // slots) if slots > 1 else 0)
+    else:
+        intra_threads = int(intra)
+    if intra_threads > 0:
+        torch.set_num_threads(intra_threads)
+
+    inter_threads = int(config["inter_op_threads"])
+    if inter_threads > 0:
+        try:
+            torch.set_num_interop_threads(inter_threads)
+        except RuntimeError as e:
+            # only allowed before the first inter-op work of the process (e.g. not in a forked child)
+            print(f"Warning: could not set inter-op threads: {e}")
+
+    _STATE.update({
+        "pid": os.getpid(),
+        "cpus": format_cpu_list(cpus),
+        "pinned": pinned,
+        "slot": slot,
+        "slots": slots,
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+    })
+    if pinned or intra_threads > 0 or inter_threads > 0:
+        where = f" (pinned, slot {slot}/{slots})" if pinned and slot is not None else (" (pinned)" if pinned else "")
+        print(f"CPU config: cpus {_STATE['cpus']}{where}, "
+              f"intra-op threads {_STATE['intra_op_threads']}, inter-op threads {_STATE['inter_op_threads']}")
+    return status()
+
+
+def status() -> Dict[str, Any]:
+    return {k: v for k, v in _STATE.items() if k != "pid"}
@@ -0,0 +1,183 @@
+# jobs.py
+"""
+Persistent job queue for asynchronous predictions (SQLite).
+
+A submitted upload is stored with its form fields and a dedup key; workers
+claim queued jobs atomically (safe across uvicorn worker processes sharing the
+file), store the normalized result as JSON and drop the upload bytes. A worker
+heartbeats the jobs it holds; jobs "running" with no heartbeat for a while
+(their process died) go back to the queue, up to max_attempts. A retry of the same request (same upload, form
+fields and model version, or the same Idempotency-Key) returns the existing
+job instead of queueing the work again.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    dedup_key   TEXT NOT NULL,
+    status      TEXT NOT NULL,            -- queued | running | done | failed
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    heartbeat_at REAL,                    -- last sign of life from the worker holding the job
+    finished_at REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    user_id     TEXT,
+    meta        TEXT,
+    filename    TEXT,
+    payload     BLOB,                     -- upload bytes; cleared once the job finishes
+    result      TEXT,                     -- normalized prediction (JSON)
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, created_at);
+"""
+
+_PUBLIC_FIELDS = ("id", "status", "created_at", "started_at", "finished_at", "attempts", "filename", "error")
+
+
+def dedup_key(content: bytes, user_id: Optional[str], meta: Optional[str], version: Optional[str],
+              idempotency_key: Optional[str] = None) -> str:
+    """Identity of a request for deduplication: the client's Idempotency-Key, or what it submitted"""
+    h = hashlib.sha256()
+    if idempotency_key:
+        h.update(b"idempotency:" + idempotency_key.encode())
+    else:
+        for part in (user_id or "", meta or "", version or ""):
+            h.update(part.encode() + b"\0")
+        h.update(content)
+    return h.hexdigest()
+
+
+class JobStore:
+    def __init__(self, path: str, ttl_s: float = 86400.0, max_attempts: int = 3):
+        self.path = path
+        self.ttl_s = float(ttl_s)
+        self.max_attempts = int(max_attempts)
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "heartbeat_at" not in columns:  # database created before heartbeats
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread; WAL lets readers (polling, SSE) run alongside the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, content: bytes, key: str, user_id: Optional[str] = None, meta: Optional[str] = None,
+               filename: Optional[str] = None, max_queued: int = 0):
+        """Queue a job, or return the live/finished job with the same key; returns (job, deduplicated)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE dedup_key = ? AND status != 'failed' AND created_at > ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, time.time() - self.ttl_s),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return self.get(row["id"]), True
+            if max_queued and self._count(conn, "queued") >= max_queued:
+                conn.execute("COMMIT")
+                return None, False
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, dedup_key, status, created_at, user_id, meta, filename, payload) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, key, time.time(), user_id, meta, filename, sqlite3.Binary(content)),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(job_id), False
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to running; returns it with its payload"""
+        now = time.time()
+        row = self._conn().execute(
+            "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, attempts = attempts + 1 "
+            "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1) "
+            "RETURNING id, user_id, meta, filename, payload, attempts",
+            (now, now),
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def heartbeat(self, job_id: str) -> bool:
+        """Mark a running job as still held by a live worker; False if it is no longer running"""
+        return self._conn().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'", (time.time(), job_id)
+        ).rowcount > 0
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, payload = NULL WHERE id = ?",
+            ("failed" if error else "done", time.time(), None if error else json.dumps(result), error, job_id),
+        )
+
+    def requeue_stale(self, stale_s: float) -> int:
+        """Put running jobs without a heartbeat for stale_s (their process died) back in the queue, or fail them after max_attempts"""
+        conn = self._conn()
+        cutoff = time.time() - stale_s
+        last_seen = "COALESCE(heartbeat_at, started_at)"
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, payload = NULL, error = 'gave up after repeated worker crashes' "
+            f"WHERE status = 'running' AND {last_seen} < ? AND attempts >= ?",
+            (time.time(), cutoff, self.max_attempts),
+        )
+        return conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, heartbeat_at = NULL "
+            f"WHERE status = 'running' AND {last_seen} < ?",
+            (cutoff,),
+        ).rowcount
+
+    def purge(self) -> int:
+        """Delete finished jobs older than the TTL"""
+        return self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - self.ttl_s,),
+        ).rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._public(row)
+        if job["status"] == "queued":
+            job["queue_position"] = self._conn().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (row["created_at"],)
+            ).fetchone()[0]
+        return job
+
+    def _public(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = {k: row[k] for k in _PUBLIC_FIELDS}
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def _count(self, conn: sqlite3.Connection, status: str) -> int:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in ("queued", "running", "done", "failed")}
+        counts.update({status: n for status, n in rows})
+        return counts
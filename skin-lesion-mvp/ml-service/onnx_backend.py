@@ -0,0 +1,213 @@
+# onnx_backend.py
+"""
+ONNX Runtime (CPU) inference backend for the ensemble.
+
+    python onnx_backend.py export [--models DIR] [--out DIR]   # export, then parity check
+    python onnx_backend.py check  [--models DIR] [--out DIR]   # parity + latency, torch vs. ORT
+
+Each backbone is exported to <out>/<name>.onnx (default out: <models>/.onnx)
+with a dynamic batch axis, plus a manifest recording the source weight files
+(same format as the shared weight store, so staleness is checked the same way).
+
+With INFERENCE_BACKEND=onnx, app._ensure_loaded serves from ONNX Runtime
+sessions instead of the eager PyTorch models. OrtBackbone is a drop-in
+callable (tensor in, logits out), so predict_tensor, the cascade and the
+server paths are unchanged. Session threads come from ORT_INTRA_OP_THREADS
+(default: torch's intra-op thread count, as set by cpu_config.py) and
+ORT_INTER_OP_THREADS (0 = onnxruntime default).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import app as core
+
+torch = core.torch
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional: only needed for INFERENCE_BACKEND=onnx
+    ort = None
+
+ONNX_OPSET = 17
+PARITY_TOLERANCE = 1e-3  # max abs difference of softmax probabilities
+
+
+def _require_ort():
+    if ort is None:
+        raise RuntimeError("INFERENCE_BACKEND=onnx needs onnxruntime (pip install onnxruntime)")
+
+
+def default_onnx_dir(models_dir):
+    return os.environ.get("ONNX_MODELS_DIR") or os.path.join(models_dir, ".onnx")
+
+
+def export_onnx(loaded_models, out_dir, sources=None, opset=ONNX_OPSET):
+    """Export each loaded backbone to <out_dir>/<name>.onnx and write the manifest"""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"opset": opset, "models": {}}
+    for model_name, model in loaded_models.items():
+        module = getattr(model, "module", model)  # unwrap PrecisionModel
+        device = next(module.parameters()).device
+        filename = f"{model_name}.onnx"
+        tmp_path = os.path.join(out_dir, filename + f".{os.getpid()}.tmp")
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            torch.onnx.export(
+                module.eval(), torch.zeros(1, 3, 224, 224, device=device), tmp_path,
+                input_names=["input"], output_names=["logits"],
+                dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=opset, dynamo=False,
+            )
+        os.replace(tmp_path, os.path.join(out_dir, filename))
+        print(f"Exported {model_name} to {os.path.join(out_dir, filename)} in {time.perf_counter() - t0:.1f}s")
+        entry = {"file": filename}
+        if sources and model_name in sources:
+            entry.update(core._source_signature(sources[model_name]))
+        manifest["models"][model_name] = entry
+    manifest_tmp = os.path.join(out_dir, core.WEIGHT_STORE_MANIFEST + f".{os.getpid()}.tmp")
+    with open(manifest_tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_tmp, os.path.join(out_dir, core.WEIGHT_STORE_MANIFEST))
+    return manifest
+
+
+class OrtBackbone:
+    """Callable stand-in for a torch backbone: [N,3,224,224] tensor -> logits tensor, run by ONNX Runtime"""
+
+    def __init__(self, path, intra_op_threads=0, inter_op_threads=0):
+        _require_ort()
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.intra_op_num_threads = intra_op_threads
+        opts.inter_op_num_threads = inter_op_threads
+        opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        inputs = x.detach().cpu().numpy().astype(np.float32, copy=False)
+        return torch.from_numpy(self.session.run(None, {self.input_name: inputs})[0])
+
+    def eval(self):
+        return self
+
+
+def load_onnx_models(onnx_dir, intra_op_threads=None, inter_op_threads=None):
+    """One ORT session per backbone listed in the manifest; returns (loaded_models, device, manifest)"""
+    if intra_op_threads is None:
+        intra_op_threads = int(os.environ.get("ORT_INTRA_OP_THREADS") or torch.get_num_threads())
+    if inter_op_threads is None:
+        inter_op_threads = int(os.environ.get("ORT_INTER_OP_THREADS", "0"))
+    with open(os.path.join(onnx_dir, core.WEIGHT_STORE_MANIFEST)) as f:
+        manifest = json.load(f)
+
+    loaded_models = {}
+    for model_name, entry in manifest["models"].items():
+        loaded_models[model_name] = OrtBackbone(os.path.join(onnx_dir, entry["file"]), intra_op_threads, inter_op_threads)
+    print(f"Loaded {len(loaded_models)} ONNX Runtime sessions from {onnx_dir} "
+          f"(intra-op threads {intra_op_threads or 'default'}, inter-op threads {inter_op_threads or 'default'})")
+    return (loaded_models or None), torch.device("cpu"), manifest
+
+
+def ensure_exported(models_dir, onnx_dir=None):
+    """Export the ONNX models unless the existing export matches the weight files; returns the ONNX dir"""
+    onnx_dir = onnx_dir or default_onnx_dir(models_dir)
+    if core.weight_store_is_current(onnx_dir, models_dir):
+        return onnx_dir
+    print(f"ONNX export in {onnx_dir} is missing or stale; exporting")
+    loaded_models, _ = core.load_models(models_dir)
+    if not loaded_models:
+        raise RuntimeError("Models failed to load; check MODELS_DIR and weight files.")
+    export_onnx(loaded_models, onnx_dir, sources=core.find_model_files(models_dir))
+    return onnx_dir
+
+
+def _parity_inputs():
+    """Bundled sample images plus a few random tensors, as one [N,3,224,224] batch"""
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cancer_images")
+    paths = sorted(os.path.join(sample_dir, f) for f in os.listdir(sample_dir)) if os.path.isdir(sample_dir) else []
+    batches = [core.images_to_tensor(paths, "cpu")] if paths else []
+    batches.append(torch.randn(4, 3, 224, 224, generator=torch.Generator().manual_seed(0)))
+    return torch.cat(batches)
+
+
+def _timed(model, x, repeat):
+    model(x)  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = model(x)
+    return torch.softmax(out, dim=1).numpy(), (time.perf_counter() - t0) * 1000.0 / repeat
+
+
+def check_parity(torch_models, onnx_models, repeat=5):
+    """Compare ORT against PyTorch per backbone: max |Δp|, top-1 agreement and batch latency"""
+    x = _parity_inputs()
+    report, torch_ens, ort_ens = {}, [], []
+    with torch.no_grad():
+        for model_name, model in torch_models.items():
+            if model_name not in onnx_models:
+                continue
+            ref, torch_ms = _timed(model, x, repeat)
+            out, ort_ms = _timed(onnx_models[model_name], x, repeat)
+            torch_ens.append(ref)
+            ort_ens.append(out)
+            report[model_name] = {
+                "max_abs_diff": float(np.abs(ref - out).max()),
+                "top1_agreement": float((ref.argmax(1) == out.argmax(1)).mean()),
+                "torch_ms": torch_ms,
+                "onnx_ms": ort_ms,
+            }
+    if torch_ens:
+        ref, out = np.mean(torch_ens, axis=0), np.mean(ort_ens, axis=0)
+        report["ensemble"] = {
+            "max_abs_diff": float(np.abs(ref - out).max()),
+            "top1_agreement": float((ref.argmax(1) == out.argmax(1)).mean()),
+            "torch_ms": sum(r["torch_ms"] for r in report.values()),
+            "onnx_ms": sum(r["onnx_ms"] for r in report.values()),
+        }
+
+    print(f"\nParity on a batch of {x.shape[0]} images")
+    print(f"{'model':<14}{'max Δp':>10}{'top-1 agr':>11}{'torch ms':>10}{'onnx ms':>10}")
+    for model_name, r in report.items():
+        print(f"{model_name:<14}{r['max_abs_diff']:>10.2e}{r['top1_agreement']:>11.1%}{r['torch_ms']:>10.1f}{r['onnx_ms']:>10.1f}")
+    return report
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Export the backbones to ONNX and check parity with PyTorch")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--models", default=os.environ.get("MODELS_DIR", os.path.join(script_dir, "models")))
+    parser.add_argument("--out", help="ONNX directory (default: ONNX_MODELS_DIR or <models>/.onnx)")
+    parser.add_argument("--opset", type=int, default=ONNX_OPSET)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per backbone in the parity check")
+    args = parser.parse_args()
+
+    models_dir = core.resolve_models_dir(args.models)
+    onnx_dir = args.out or default_onnx_dir(models_dir)
+    torch_models, _ = core.load_models(models_dir)
+    if not torch_models:
+        raise SystemExit("Error: Could not load any models. Exiting.")
+
+    if args.command == "export":
+        export_onnx(torch_models, onnx_dir, sources=core.find_model_files(models_dir), opset=args.opset)
+    elif not os.path.exists(os.path.join(onnx_dir, core.WEIGHT_STORE_MANIFEST)):
+        raise SystemExit(f"Error: no ONNX export in {onnx_dir}; run `python onnx_backend.py export` first")
+
+    onnx_models, _, _ = load_onnx_models(onnx_dir)
+    report = check_parity(torch_models, onnx_models, repeat=args.repeat)
+    worst = max(r["max_abs_diff"] for r in report.values())
+    if worst > PARITY_TOLERANCE:
+        print(f"\nParity check FAILED: max |Δp| {worst:.2e} > {PARITY_TOLERANCE}")
+        sys.exit(1)
+    print(f"\nParity check passed (max |Δp| {worst:.2e} <= {PARITY_TOLERANCE})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# registry.py
+"""
+Versioned model sets that can be swapped without restarting the service.
+
+A ModelSet is everything one inference needs (backbones, device, fused
+ensemble, version, weight-file checksums), built together and never mutated.
+The registry holds the active set behind a single reference. A request reads
+that reference once and uses the same set to the end, so a reload can build
+the replacement in the background and swap the reference in one assignment;
+in-flight requests finish on the old set, which is freed once they drop it.
+Both sets are resident while the new one loads and warms up.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+_CHECKSUMS: Dict[tuple, str] = {}  # (path, size, mtime) -> sha256
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """sha256 of a file, cached while its size and mtime are unchanged"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime)
+    digest = _CHECKSUMS.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                h.update(block)
+        digest = _CHECKSUMS[key] = h.hexdigest()
+    return digest
+
+
+class ModelSet:
+    def __init__(self, models, device, version, fused=None, files=None, embeddings=None):
+        self.models = models        # {name: backbone callable}, or None if nothing loaded
+        self.device = device
+        self.version = version
+        self.fused = fused          # optional EnsembleModule (FUSED_ENSEMBLE)
+        self.files = files or {}    # {name: {source, size, mtime, sha256}}
+        self.embeddings = embeddings or []  # backbones whose penultimate embeddings are captured
+        self.loaded_at = time.time()
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "backbones": list(self.models or {}),
+            "fused": self.fused is not None,
+            "embeddings": self.embeddings,
+            "files": self.files,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, builder: Callable[[], ModelSet], prepare: Optional[Callable[[ModelSet], object]] = None,
+                 history: int = 5):
+        self._builder = builder      # loads a fresh ModelSet from the current configuration
+        self._prepare = prepare      # e.g. warm-up; runs on a new set before it goes live
+        self._lock = threading.Lock()  # one build at a time
+        self._active: Optional[ModelSet] = None
+        self._history = deque(maxlen=history)
+        self._reloading = False
+        self._reloads = 0
+        self._last_error: Optional[str] = None
+
+    @property
+    def active(self) -> Optional[ModelSet]:
+        return self._active
+
+    def ensure(self) -> ModelSet:
+        """The active set, building it on first use (and retrying while nothing could be loaded)"""
+        current = self._active
+        if current is not None and current.models is not None:
+            return current
+        with self._lock:
+            if self._active is None or self._active.models is None:
+                self._active = self._builder()
+            return self._active
+
+    def reload(self, force: bool = False) -> Dict[str, object]:
+        """Build, prepare and swap in a new set; the old one keeps serving until the swap"""
+        with self._lock:
+            self._reloading = True
+            started = time.perf_counter()
+            previous = self._active
+            try:
+                candidate = self._builder()
+                if candidate.models is None:
+                    raise RuntimeError("new model set failed to load; keeping the active one")
+                if not force and previous is not None and previous.models is not None \
+                        and candidate.version == previous.version:
+                    return {"swapped": False, "version": previous.version, "previous": previous.version,
+                            "reload_s": time.perf_counter() - started}
+                if self._prepare is not None:
+                    self._prepare(candidate)
+            except Exception as e:
+                self._last_error = str(e)
+                raise
+            finally:
+                self._reloading = False
+
+            self._active = candidate  # atomic: every request from here on sees the new set
+            self._reloads += 1
+            self._last_error = None
+            if previous is not None and previous.models is not None:
+                self._history.appendleft({"version": previous.version, "loaded_at": previous.loaded_at,
+                                          "replaced_at": time.time()})
+            return {"swapped": True, "version": candidate.version,
+                    "previous": previous.version if previous is not None else None,
+                    "reload_s": time.perf_counter() - started}
+
+    def status(self) -> Dict[str, object]:
+        current = self._active
+        return {
+            "active": current.describe() if current is not None and current.models is not None else None,
+            "reloading": self._reloading,
+            "reloads": self._reloads,
+            "last_error": self._last_error,
+            "history": list(self._history),
+        }
@@ -0,0 +1,57 @@
+# serve.py
+"""
+Multi-process serving with one shared, read-only copy of the model weights.
+
+    python serve.py --workers 4 --port 8000
+
+The weight files are loaded once here and exported to a memory-mappable
+weight store (re-exported only when the source files change; after a hot
+reload, by the first worker that sees the change). Every uvicorn
+worker then memory-maps that store instead of loading its own copy, so
+resident memory stays roughly flat as workers are added.
+"""
+import argparse
+import os
+
+import uvicorn
+
+import app as core
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    default_models = os.environ.get("MODELS_DIR", os.path.join(script_dir, "models"))
+
+    parser = argparse.ArgumentParser(description="Run server.py on several worker processes with shared weights")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="uvicorn worker processes")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--models", default=default_models, help="directory with the original weight files")
+    parser.add_argument("--store", default=None, help="weight store directory (default: <models>/.shared)")
+    args = parser.parse_args()
+
+    models_dir = core.resolve_models_dir(args.models)
+    store_dir = args.store or os.path.join(models_dir, ".shared")
+
+    if os.environ.get("INFERENCE_BACKEND", "torch").lower() == "onnx":
+        # export once here so the workers don't race to write the same files
+        import onnx_backend
+        os.environ["ONNX_MODELS_DIR"] = onnx_backend.ensure_exported(models_dir)
+    else:
+        try:
+            if not core.ensure_weight_store(store_dir, models_dir):
+                print(f"Weight store {store_dir} is up to date")
+        except RuntimeError as e:
+            raise SystemExit(f"Error: {e}. Exiting.")
+
+    # inherited by the spawned workers; app._ensure_loaded picks it up
+    os.environ["MODELS_DIR"] = models_dir
+    os.environ["SHARED_WEIGHTS_DIR"] = store_dir
+    # sizes the per-worker thread pools / CPU slices (cpu_config.py)
+    os.environ["SERVE_WORKERS"] = str(args.workers)
+
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,113 @@
 # server.py
-import io, os, traceback, json, inspect
-from typing import Dict, Any, Optional
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import io, os, traceback, json, inspect, asyncio, time, hmac, tempfile
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from PIL import Image
 import app as core
+from batching import MicroBatcher
+from workers import InferencePool, Saturated
+from cache import PredictionCache, image_key
+from metrics import Registry, render_stats
+from uploads import UploadLimitMiddleware
+from jobs import JobStore, dedup_key
+import similar_index
 from math import isfinite
 
-MALIGNANT = {"mel", "bcc", "akiec", "scc"}
-
 app = FastAPI(title="HealthAware ML Service", version="1.0.1")
 
+# CHANGE: run inference off the event loop with bounded admission (503 + Retry-After when full)
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")     # "thread" | "process"
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "32"))
+
+_POOL = InferencePool(
+    kind=INFERENCE_EXECUTOR,
+    workers=INFERENCE_WORKERS,
+    max_pending=INFERENCE_MAX_PENDING,
+    initializer=core.warm_up_worker if INFERENCE_EXECUTOR == "process" else None,  # every worker warms itself
+)
+
+# CHANGE: micro-batch concurrent /predict calls (BATCH_MAX_SIZE=1 disables)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+_BATCHER: Optional[MicroBatcher] = None
+if BATCH_MAX_SIZE > 1 and callable(getattr(core, "predict_image_batch", None)):
+    _BATCHER = MicroBatcher(
+        core.predict_image_batch,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        executor=_POOL.executor,
+        concurrency=INFERENCE_WORKERS,  # one batch per pool worker
+    )
+
+# CHANGE: content-addressed cache for repeated uploads (PREDICTION_CACHE_MAX_ENTRIES=0 disables)
+_CACHE = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("PREDICTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl_s=float(os.getenv("PREDICTION_CACHE_TTL_S", "3600")),
+)
+
+# CHANGE: hot-path instrumentation exposed on /metrics (Prometheus text format)
+_METRICS = Registry()
+_REQUESTS = _METRICS.counter("healthaware_requests_total", "Prediction requests by endpoint and outcome")
+_STAGE_SECONDS = _METRICS.histogram("healthaware_stage_seconds", "Per-request time spent in each inference stage")
+_FORWARD_SECONDS = _METRICS.histogram("healthaware_backbone_forward_seconds", "Backbone forward time seen by each request (whole batch)")
+_MODEL_LOAD_SECONDS = _METRICS.gauge("healthaware_model_load_seconds", "Model load time by backbone and phase")
+_MODEL_RELOADS = _METRICS.counter("healthaware_model_reloads_total", "Model hot-reload attempts by outcome")
+
+# CHANGE: limits for /predict/batch (one visit, several lesions)
+PREDICT_BATCH_MAX_FILES = int(os.getenv("PREDICT_BATCH_MAX_FILES", "16"))
+PREDICT_BATCH_MAX_BYTES = int(os.getenv("PREDICT_BATCH_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# CHANGE: per-image upload cap; bodies over the limit are cut off with 413 while streaming in
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+# CHANGE: load + warm up models at startup; /ready flips only once that finished
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1") != "0"
+
+_READINESS: Dict[str, Any] = {"ready": False, "error": None, "timings": None}
+_PRELOAD_TASK: Optional[asyncio.Task] = None
+
+# CHANGE: hot model reload. /admin/* needs ADMIN_TOKEN (disabled when unset);
+# MODEL_RELOAD_POLL_S > 0 also reloads automatically when the weight files change
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+MODEL_RELOAD_POLL_S = float(os.getenv("MODEL_RELOAD_POLL_S", "0"))
+_RELOAD_TASK: Optional[asyncio.Task] = None
+_POLL_TASK: Optional[asyncio.Task] = None
+
+# CHANGE: asynchronous jobs (POST /jobs, then poll GET /jobs/{id} or stream /jobs/{id}/events).
+# Jobs live in SQLite so they survive restarts and are shared by all workers using the same JOB_DB_PATH.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))                 # per process; 0 disables the job API
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "healthaware-jobs.sqlite3"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))         # 503 once this many jobs are waiting
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "86400"))               # finished jobs (and dedup) are kept this long
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "300"))             # "running" longer than this = worker died
+JOB_MAX_WAIT_S = 30.0                                            # cap for GET /jobs/{id}?wait=
+
+# CHANGE: similar-case lookup (POST /similar) against an index built with `python similar_index.py build`
+SIMILAR_INDEX_DIR = os.getenv("SIMILAR_INDEX_DIR", "")           # unset: /similar answers 404
+SIMILAR_MAX_K = int(os.getenv("SIMILAR_MAX_K", "50"))
+
+_JOBS: Optional[JobStore] = JobStore(JOB_DB_PATH, ttl_s=JOB_TTL_S, max_attempts=JOB_MAX_ATTEMPTS) if JOB_WORKERS > 0 else None
+_JOB_WAKEUP: Optional[asyncio.Event] = None
+_JOB_TASKS: List[asyncio.Task] = []
+
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/predict": MAX_UPLOAD_BYTES,
+        "/predict/batch": PREDICT_BATCH_MAX_BYTES,
+        "/jobs": MAX_UPLOAD_BYTES,
+        "/similar": MAX_UPLOAD_BYTES,
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=os.getenv("CORS_ALLOW_ORIGINS", "*").split(","),
@@ -32,7 +128,7 @@ def _class_info() -> Dict[str, Dict[str, Any]]:
     return ci if isinstance(ci, dict) else {}
 
 def _compute_risk(class_name: str, confidence: float) -> str:
-    if class_name.lower() in MALIGNANT:
+    if class_name.lower() in core.MALIGNANT_CLASSES:
         if confidence >= 0.6: return "High"
         if confidence >= 0.35: return "Medium"
         return "Low"
@@ -113,56 +209,203 @@ def _normalize_prediction(raw: Any) -> Dict[str, Any]:
         "class_probabilities": class_probs,
     }
 
+def _decode_image(source) -> Image.Image:
+    # bytes or the upload's spooled file; JPEGs decode near model size, EXIF-rotated
+    return core.load_image(source)
+
+def _decode_and_key(source):
+    image = _decode_image(source)
+    return image, (image_key(image) if _CACHE.enabled else None)
+
+def _upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, io.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+# With INFERENCE_EXECUTOR=process the models (and their registry) only exist in the worker processes,
+# so this process learns the version from warm_up() and from results. Hot reload is off in that mode,
+# so the version cannot change underneath the cache.
+_WORKER_MODEL_VERSION: Dict[str, Optional[str]] = {"version": None}
+
+def _model_version() -> Optional[str]:
+    if INFERENCE_EXECUTOR == "process":
+        return _WORKER_MODEL_VERSION["version"]
+    fn = getattr(core, "model_version", None)
+    return fn() if callable(fn) else None
+
+def _result_version(raw: Any) -> Optional[str]:
+    # the set that produced the result, not the one active now (a reload may have swapped in between)
+    if isinstance(raw, dict) and raw.get("model_version"):
+        if INFERENCE_EXECUTOR == "process":
+            _WORKER_MODEL_VERSION["version"] = raw["model_version"]
+        return raw["model_version"]
+    return _model_version()
+
+def _attach(raw: Any, userId: Optional[str], meta_obj: Optional[dict]) -> Any:
+    if isinstance(raw, dict):
+        if userId is not None:
+            raw["user_id"] = userId
+        if meta_obj is not None:
+            raw["meta"] = meta_obj
+    return raw
+
+def _cacheable(raw: Any) -> Any:
+    # per-request passthrough fields never go into the shared cache
+    if isinstance(raw, dict):
+        cached = {k: v for k, v in raw.items() if k not in ("user_id", "meta", "timings")}
+        if isinstance(cached.get("tta"), dict):
+            cached["tta"] = {**cached["tta"], "pass_ms": 0.0}  # a hit runs no TTA pass
+        return cached
+    return raw
+
+def _pop_timings(raw: Any, stages: Dict[str, float]):
+    if isinstance(raw, dict) and isinstance(raw.get("timings"), dict):
+        stages.update(raw.pop("timings"))
+
+@contextmanager
+def _track(endpoint: str, stages: Dict[str, float], received_at: Optional[float] = None):
+    """Count the request by outcome and record its stage timings.
+
+    With `received_at` (stamped by UploadLimitMiddleware) the time until the handler ran
+    is the "upload" stage and "total" counts from receipt.
+    """
+    started = time.perf_counter()
+    if received_at is not None:
+        stages["upload"] = started - received_at
+    else:
+        received_at = started
+    outcome = "ok"
+    try:
+        yield
+    except Saturated:
+        outcome = "busy"
+        raise
+    except HTTPException as e:
+        outcome = "rejected" if e.status_code < 500 else "error"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        stages["total"] = time.perf_counter() - received_at
+        _REQUESTS.inc(endpoint=endpoint, outcome=outcome)
+        for stage, seconds in stages.items():
+            if stage.startswith("forward_"):
+                _FORWARD_SECONDS.observe(seconds, backbone=stage[len("forward_"):])
+            else:
+                _STAGE_SECONDS.observe(seconds, stage=stage)
+
+def _received_at(request: Request) -> Optional[float]:
+    return getattr(request.state, "received_at", None)
+
+def _server_timing(stages: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000.0:.1f}" for stage, seconds in stages.items())
+
+def _run_inference(image: Image.Image, userId: Optional[str], meta_obj: Optional[dict]) -> Any:
+    """Unbatched fallback chain; runs inside the inference pool."""
+    # 1) Prefer predict_image(image, user_id=..., meta=...)
+    if hasattr(core, "predict_image") and callable(core.predict_image):
+        return core.predict_image(image, user_id=userId, meta=meta_obj)
+
+    # 2) Else try inference(image, ...) with kwargs only if accepted
+    if hasattr(core, "inference") and callable(core.inference):
+        fn = core.inference
+        sig = inspect.signature(fn)
+        kwargs = {}
+        if "user_id" in sig.parameters: kwargs["user_id"] = userId
+        if "meta" in sig.parameters: kwargs["meta"] = meta_obj
+        return fn(image, **kwargs) if "image" in sig.parameters else fn(**kwargs)
+
+    # 3) Else fallback to predict(...) WITHOUT user kwargs (to avoid your error)
+    if hasattr(core, "predict") and callable(core.predict):
+        fn = core.predict
+        sig = inspect.signature(fn)
+        # if your predict accepts a PIL image param named 'image', pass it; otherwise just call and let your code load from disk
+        if "image" in sig.parameters:
+            return fn(image)
+        # Last resort: call with no kwargs; your function likely loads internally
+        return fn()
+
+    raise RuntimeError("No predict_image() / inference() / predict() function found in app.py")
+
+def _busy(e: Saturated) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Inference capacity exhausted; retry later",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
 @app.post("/predict")
 async def predict(
+    request: Request,
+    response: Response,
     file: UploadFile = File(...),
     userId: Optional[str] = Form(default=None),  # optional personalization
     meta: Optional[str] = Form(default=None),    # optional JSON string
+    timing: bool = False,                        # ?timing=1 adds a Server-Timing header
 ):
+    stages: Dict[str, float] = {}
+    try:
+        with _track("/predict", stages, _received_at(request)):
+            with _POOL.admit():
+                body = await _predict(file, userId, meta, stages)
+    except Saturated as e:
+        raise _busy(e)
+    if timing:
+        response.headers["Server-Timing"] = _server_timing(stages)
+    return body
+
+async def _predict(file: UploadFile, userId: Optional[str], meta: Optional[str], stages: Dict[str, float]):
+    if _upload_size(file) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload too large (max {MAX_UPLOAD_BYTES} bytes)")
     try:
-        content = await file.read()
-        image = Image.open(io.BytesIO(content)).convert("RGB")
+        # PIL decode (and pixel hashing) is CPU-bound too; keep it off the event loop.
+        # It reads straight from the spooled upload, so the file is never copied into one bytes object.
+        t0 = time.perf_counter()
+        image, cache_key = await asyncio.to_thread(_decode_and_key, file.file)
+        stages["decode"] = time.perf_counter() - t0
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid image file")
 
-    meta_obj: Optional[dict] = None
-    if meta:
-        try:
-            meta_obj = json.loads(meta)
-        except Exception:
-            meta_obj = None
-
-    try:
-        raw = None
-
-        # 1) Prefer predict_image(image, user_id=..., meta=...)
-        if hasattr(core, "predict_image") and callable(core.predict_image):
-            raw = core.predict_image(image, user_id=userId, meta=meta_obj)
-
-        # 2) Else try inference(image, ...) with kwargs only if accepted
-        elif hasattr(core, "inference") and callable(core.inference):
-            fn = core.inference
-            sig = inspect.signature(fn)
-            kwargs = {}
-            if "user_id" in sig.parameters: kwargs["user_id"] = userId
-            if "meta" in sig.parameters: kwargs["meta"] = meta_obj
-            raw = fn(image, **kwargs) if "image" in sig.parameters else fn(**kwargs)
-
-        # 3) Else fallback to predict(...) WITHOUT user kwargs (to avoid your error)
-        elif hasattr(core, "predict") and callable(core.predict):
-            fn = core.predict
-            sig = inspect.signature(fn)
-            # if your predict accepts a PIL image param named 'image', pass it; otherwise just call and let your code load from disk
-            if "image" in sig.parameters:
-                raw = fn(image)
-            else:
-                # Last resort: call with no kwargs; your function likely loads internally
-                raw = fn()
+    return await _infer(image, cache_key, userId, _parse_meta(meta), stages)
+
+def _parse_meta(meta: Optional[str]) -> Optional[dict]:
+    if not meta:
+        return None
+    try:
+        return json.loads(meta)
+    except Exception:
+        return None
+
+async def _infer(image: Image.Image, cache_key: Optional[str], userId: Optional[str], meta_obj: Optional[dict],
+                 stages: Dict[str, float]):
+    """Cache lookup, batched/pooled inference and normalization for one decoded image."""
+    try:
+        t0 = time.perf_counter()
+        version = _model_version()
+        raw = _CACHE.get(cache_key, version) if (cache_key and version) else None
 
+        if raw is not None:
+            _attach(raw, userId, meta_obj)
+        # Batched path shares one forward pass per backbone with concurrent requests
+        elif _BATCHER is not None:
+            raw = await _BATCHER.submit(image)
+            if cache_key and _result_version(raw):
+                _CACHE.put(cache_key, _result_version(raw), _cacheable(raw))
+            _attach(raw, userId, meta_obj)
         else:
-            raise RuntimeError("No predict_image() / inference() / predict() function found in app.py")
+            raw = await _POOL.run(_run_inference, image, userId, meta_obj)
+            if cache_key and _result_version(raw):
+                _CACHE.put(cache_key, _result_version(raw), _cacheable(raw))
+        stages["inference"] = time.perf_counter() - t0
+        _pop_timings(raw, stages)
 
+        t0 = time.perf_counter()
         normalized = _normalize_prediction(raw)
+        stages["normalize"] = time.perf_counter() - t0
         return jsonable_encoder(normalized)
 
     except HTTPException:
@@ -171,6 +414,449 @@ async def predict(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
 
+def _parse_batch_meta(meta: Optional[str], n: int) -> List[Optional[dict]]:
+    """meta is either a JSON list (one entry per file) or one JSON object applied to every file."""
+    if not meta:
+        return [None] * n
+    try:
+        parsed = json.loads(meta)
+    except Exception:
+        return [None] * n
+    if isinstance(parsed, list):
+        return [parsed[i] if i < len(parsed) else None for i in range(n)]
+    return [parsed] * n
+
+@app.post("/predict/batch")
+async def predict_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    userId: Optional[str] = Form(default=None),
+    meta: Optional[str] = Form(default=None),    # JSON list aligned with files, or one object for all
+):
+    stages: Dict[str, float] = {}
+    try:
+        with _track("/predict/batch", stages, _received_at(request)):
+            if len(files) > PREDICT_BATCH_MAX_FILES:
+                raise HTTPException(status_code=413, detail=f"Too many files (max {PREDICT_BATCH_MAX_FILES})")
+            with _POOL.admit():
+                return await _predict_batch(files, userId, meta, stages)
+    except Saturated as e:
+        raise _busy(e)
+
+async def _predict_batch(files: List[UploadFile], userId: Optional[str], meta: Optional[str], stages: Dict[str, float]):
+    total = 0
+    for f in files:
+        size = _upload_size(f)
+        total += size
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"{f.filename} too large (max {MAX_UPLOAD_BYTES} bytes)")
+        if total > PREDICT_BATCH_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Batch payload too large (max {PREDICT_BATCH_MAX_BYTES} bytes)")
+    metas = _parse_batch_meta(meta, len(files))
+
+    def decode_all():
+        out = []
+        for f in files:
+            try:
+                out.append(_decode_and_key(f.file) + (None,))
+            except Exception:
+                out.append((None, None, "Invalid image file"))
+        return out
+
+    decoded = await asyncio.to_thread(decode_all)
+
+    version = _model_version()
+    raws: List[Any] = [None] * len(files)
+    misses = []
+    for i, (image, cache_key, err) in enumerate(decoded):
+        if err is None and cache_key and version:
+            raws[i] = _CACHE.get(cache_key, version)
+        if err is None and raws[i] is None:
+            misses.append(i)
+
+    try:
+        # all uncached images go through one batched ensemble pass
+        if misses:
+            if callable(getattr(core, "predict_image_batch", None)):
+                fresh = await _POOL.run(core.predict_image_batch, [decoded[i][0] for i in misses])
+            else:
+                fresh = [await _POOL.run(_run_inference, decoded[i][0], None, None) for i in misses]
+            for i, raw in zip(misses, fresh):
+                _pop_timings(raw, stages)
+                raws[i] = raw
+                if decoded[i][1] and _result_version(raw):
+                    _CACHE.put(decoded[i][1], _result_version(raw), _cacheable(raw))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
+
+    results = []
+    for i, f in enumerate(files):
+        err = decoded[i][2]
+        if err is not None:
+            results.append({"filename": f.filename, "error": err})
+            continue
+        normalized = _normalize_prediction(_attach(raws[i], userId, metas[i]))
+        normalized["filename"] = f.filename
+        results.append(normalized)
+
+    return jsonable_encoder({"count": len(results), "results": results})
+
+def _job_store() -> JobStore:
+    if _JOBS is None:
+        raise HTTPException(status_code=404, detail="Job API disabled (JOB_WORKERS=0)")
+    return _JOBS
+
+def _job_response(job: Dict[str, Any], **extra) -> JSONResponse:
+    finished = job["status"] in ("done", "failed")
+    return JSONResponse(
+        status_code=200 if finished else 202,
+        content=jsonable_encoder({**job, **extra}),
+        headers={"Location": f"/jobs/{job['id']}"},
+    )
+
+@app.post("/similar")
+async def similar(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    userId: Optional[str] = Form(default=None),
+    meta: Optional[str] = Form(default=None),
+    k: int = 5,                                  # nearest reference cases to return
+    embeddings: bool = False,                    # ?embeddings=1 also returns the raw embeddings and logits
+    timing: bool = False,
+):
+    """Prediction plus the k most similar indexed reference cases, from one forward pass."""
+    stages: Dict[str, float] = {}
+    try:
+        with _track("/similar", stages, _received_at(request)):
+            with _POOL.admit():
+                body = await _similar(file, userId, meta, k, embeddings, stages)
+    except Saturated as e:
+        raise _busy(e)
+    if timing:
+        response.headers["Server-Timing"] = _server_timing(stages)
+    return body
+
+async def _similar(file: UploadFile, userId: Optional[str], meta: Optional[str], k: int, with_embeddings: bool,
+                   stages: Dict[str, float]):
+    if not SIMILAR_INDEX_DIR:
+        raise HTTPException(status_code=404, detail="No similar-case index configured (set SIMILAR_INDEX_DIR)")
+    if not 1 <= k <= SIMILAR_MAX_K:
+        raise HTTPException(status_code=422, detail=f"k must be between 1 and {SIMILAR_MAX_K}")
+    if _upload_size(file) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload too large (max {MAX_UPLOAD_BYTES} bytes)")
+    try:
+        index = await asyncio.to_thread(similar_index.open_index, SIMILAR_INDEX_DIR)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Similar-case index unavailable: {e}")
+    try:
+        t0 = time.perf_counter()
+        image = await asyncio.to_thread(_decode_image, file.file)
+        stages["decode"] = time.perf_counter() - t0
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+
+    try:
+        # unbatched and uncached: the embeddings are per image and too large for the prediction cache
+        t0 = time.perf_counter()
+        raw = await _POOL.run(core.predict_image, image, userId, _parse_meta(meta), True)
+        stages["inference"] = time.perf_counter() - t0
+        _pop_timings(raw, stages)
+        embs = raw.pop("embeddings", None) or {}
+        logits = raw.pop("logits", None) or {}
+        version = raw.pop("embedding_version", None)
+        if not embs:
+            raise HTTPException(status_code=409, detail="The loaded models do not expose embeddings "
+                                                        "(FUSED_ENSEMBLE=script or INFERENCE_BACKEND=onnx)")
+        if index.embedding_version and version != index.embedding_version:
+            raise HTTPException(status_code=409, detail="The similar-case index was built from other model weights; rebuild it")
+
+        t0 = time.perf_counter()
+        matches, used = await asyncio.to_thread(index.search, embs, k)
+        stages["similar"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        normalized = _normalize_prediction(raw)
+        stages["normalize"] = time.perf_counter() - t0
+        normalized["similar"] = {"k": k, "backbones": used, "index_size": index.size, "results": matches}
+        if with_embeddings:
+            normalized["embeddings"] = {name: v.tolist() for name, v in embs.items()}
+            normalized["logits"] = {name: v.tolist() for name, v in logits.items()}
+        return jsonable_encoder(normalized)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
+
+@app.post("/jobs")
+async def submit_job(
+    file: UploadFile = File(...),
+    userId: Optional[str] = Form(default=None),
+    meta: Optional[str] = Form(default=None),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    """Queue a prediction; 202 + Location right away. A retried request gets the existing job back."""
+    store = _job_store()
+    if _upload_size(file) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload too large (max {MAX_UPLOAD_BYTES} bytes)")
+    content = await file.read()
+    try:
+        # header only: rejects non-images now instead of failing the job later
+        Image.open(io.BytesIO(content))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+
+    key = dedup_key(content, userId, meta, _model_version(), idempotency_key)
+    job, deduplicated = await asyncio.to_thread(
+        store.submit, content, key, userId, meta, file.filename, JOB_MAX_QUEUED
+    )
+    if job is None:
+        raise HTTPException(status_code=503, detail="Job queue full, retry later", headers={"Retry-After": "30"})
+    if not deduplicated and _JOB_WAKEUP is not None:
+        _JOB_WAKEUP.set()
+    return _job_response(job, deduplicated=deduplicated)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0.0):
+    """Job status, with the result once done; ?wait=S long-polls up to S seconds for it to finish."""
+    store = _job_store()
+    deadline = time.monotonic() + min(max(wait, 0.0), JOB_MAX_WAIT_S)
+    while True:
+        job = await asyncio.to_thread(store.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        if job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+            return _job_response(job)
+        await asyncio.sleep(0.25)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events: `status` on every change, then one `result` or `failed` event and close."""
+    store = _job_store()
+    if await asyncio.to_thread(store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    async def events():
+        last_status, last_sent = None, time.monotonic()
+        while True:
+            job = await asyncio.to_thread(store.get, job_id)
+            if job is None:  # purged meanwhile
+                return
+            if job["status"] in ("done", "failed"):
+                yield f"event: {'result' if job['status'] == 'done' else 'failed'}\ndata: {json.dumps(job)}\n\n"
+                return
+            if job["status"] != last_status:
+                last_status, last_sent = job["status"], time.monotonic()
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            elif time.monotonic() - last_sent > 15:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"  # keeps proxies from closing an idle stream
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def _heartbeat(job_id: str):
+    # keeps the janitor from requeueing a job that is only waiting for a slot (or slow), not abandoned
+    while True:
+        await asyncio.sleep(max(1.0, JOB_STALE_S / 3))
+        try:
+            await asyncio.to_thread(_JOBS.heartbeat, job_id)
+        except Exception as e:
+            print(f"Job heartbeat failed: {e}")
+
+async def _run_job(job: Dict[str, Any]):
+    stages: Dict[str, float] = {}
+    heartbeat = asyncio.get_running_loop().create_task(_heartbeat(job["id"]))
+    try:
+        with _track("/jobs", stages):
+            while True:
+                try:
+                    # same admission as /predict; interactive traffic is not starved by the backlog
+                    with _POOL.admit():
+                        try:
+                            image, cache_key = await asyncio.to_thread(_decode_and_key, io.BytesIO(job["payload"]))
+                        except Exception:
+                            raise HTTPException(status_code=400, detail="Invalid image file")
+                        body = await _infer(image, cache_key, job["user_id"], _parse_meta(job["meta"]), stages)
+                    break
+                except Saturated as e:
+                    await asyncio.sleep(e.retry_after)
+    except HTTPException as e:
+        await asyncio.to_thread(_JOBS.finish, job["id"], None, str(e.detail))
+    except Exception as e:
+        traceback.print_exc()
+        await asyncio.to_thread(_JOBS.finish, job["id"], None, f"{type(e).__name__}: {e}")
+    else:
+        await asyncio.to_thread(_JOBS.finish, job["id"], body)
+    finally:
+        heartbeat.cancel()
+
+async def _job_worker():
+    while True:
+        if not _POOL.has_capacity():
+            # leave the backlog queued (another process may have room) rather than hold a job while waiting
+            await asyncio.sleep(_POOL.retry_after())
+            continue
+        _JOB_WAKEUP.clear()
+        try:
+            job = await asyncio.to_thread(_JOBS.claim)
+        except Exception as e:
+            print(f"Job claim failed: {e}")
+            job = None
+        if job is not None:
+            await _run_job(job)
+            continue
+        # woken by a submit here; the timeout picks up jobs submitted to other processes
+        try:
+            await asyncio.wait_for(_JOB_WAKEUP.wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            pass
+
+async def _job_janitor():
+    while True:
+        try:
+            requeued = await asyncio.to_thread(_JOBS.requeue_stale, JOB_STALE_S)
+            if requeued:
+                print(f"Requeued {requeued} stale job(s)")
+                _JOB_WAKEUP.set()
+            await asyncio.to_thread(_JOBS.purge)
+        except Exception as e:
+            print(f"Job maintenance failed: {e}")
+        await asyncio.sleep(60)
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    if _READINESS["ready"]:
+        return {"status": "ready", "model_version": _model_version(), "timings": _READINESS["timings"]}
+    status = "failed" if _READINESS["error"] else "loading"
+    return JSONResponse(status_code=503, content={"status": status, "error": _READINESS["error"]})
+
+@app.get("/metrics")
+async def metrics():
+    text = _METRICS.render()
+    if _BATCHER is not None:
+        text += render_stats("healthaware_batching", _BATCHER.stats())
+    text += render_stats("healthaware_pool", _POOL.stats())
+    text += render_stats("healthaware_cache", _CACHE.stats())
+    if _JOBS is not None:
+        text += render_stats("healthaware_jobs", await asyncio.to_thread(_JOBS.stats))
+    text += f"# TYPE healthaware_ready gauge\nhealthaware_ready {int(_READINESS['ready'])}\n"
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def stats():
+    return {
+        "batching": _BATCHER.stats() if _BATCHER is not None else None,
+        "pool": _POOL.stats(),
+        "cache": _CACHE.stats(),
+        "cpu": core.cpu_config.status(),
+        "jobs": await asyncio.to_thread(_JOBS.stats) if _JOBS is not None else None,
+    }
+
+def _require_admin(authorization: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled (set ADMIN_TOKEN)")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+async def _reload(force: bool) -> Dict[str, Any]:
+    # loading runs on its own thread, not an inference slot; requests keep using the active set
+    try:
+        result = await asyncio.to_thread(core.reload_models, force)
+    except Exception:
+        _MODEL_RELOADS.inc(outcome="error")
+        traceback.print_exc()
+        raise
+    _MODEL_RELOADS.inc(outcome="swapped" if result["swapped"] else "unchanged")
+    return result
+
+@app.get("/admin/models")
+async def admin_models(authorization: Optional[str] = Header(default=None)):
+    _require_admin(authorization)
+    return jsonable_encoder(core.model_status())
+
+@app.post("/admin/models/reload")
+async def admin_reload(force: bool = False, wait: bool = False, authorization: Optional[str] = Header(default=None)):
+    """Load the current weight files and swap them in; 202 right away, or the result with ?wait=1."""
+    global _RELOAD_TASK
+    _require_admin(authorization)
+    if INFERENCE_EXECUTOR == "process":
+        raise HTTPException(status_code=409, detail="Hot reload needs INFERENCE_EXECUTOR=thread (models live in the worker processes)")
+    if _RELOAD_TASK is not None and not _RELOAD_TASK.done():
+        raise HTTPException(status_code=409, detail="A reload is already running")
+    _RELOAD_TASK = asyncio.get_running_loop().create_task(_reload(force))
+    if not wait:
+        return JSONResponse(status_code=202, content={"status": "reloading", "model_version": _model_version()})
+    try:
+        return await _RELOAD_TASK
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+
+async def _poll_weights():
+    while True:
+        await asyncio.sleep(MODEL_RELOAD_POLL_S)
+        if not _READINESS["ready"] or (_RELOAD_TASK is not None and not _RELOAD_TASK.done()):
+            continue
+        try:
+            if await asyncio.to_thread(core.models_changed):
+                print("Weight files changed; reloading models")
+                await _reload(force=False)
+        except Exception as e:
+            # keep serving the active set and try again next round
+            print(f"Model reload check failed: {e}")
+
+async def _preload():
+    try:
+        if INFERENCE_EXECUTOR == "process":
+            # one call per worker makes the pool start all of them; each warmed up in its initializer
+            reports = await asyncio.gather(*(_POOL.run(core.worker_warm_up) for _ in range(INFERENCE_WORKERS)))
+            _READINESS["timings"] = max(reports, key=lambda r: r["load_s"])  # ready once the slowest is
+            _WORKER_MODEL_VERSION["version"] = _READINESS["timings"].get("model_version")
+        else:
+            _READINESS["timings"] = await _POOL.run(core.warm_up)
+        _READINESS["ready"] = True
+        for model_name, phases in (_READINESS["timings"].get("models") or {}).items():
+            if isinstance(phases, dict):
+                for phase, seconds in phases.items():
+                    _MODEL_LOAD_SECONDS.set(seconds, backbone=model_name, phase=phase)
+        _MODEL_LOAD_SECONDS.set(_READINESS["timings"]["load_s"], backbone="all", phase="total")
+    except Exception as e:
+        traceback.print_exc()
+        _READINESS["error"] = str(e)
+
+@app.on_event("startup")
+async def _startup():
+    global _PRELOAD_TASK, _POLL_TASK, _JOB_WAKEUP
+    if PRELOAD_MODELS and callable(getattr(core, "warm_up", None)):
+        # runs in the background so /health answers while weights load
+        _PRELOAD_TASK = asyncio.get_running_loop().create_task(_preload())
+    else:
+        # lazy mode: models load on the first /predict
+        _READINESS["ready"] = True
+    if MODEL_RELOAD_POLL_S > 0 and INFERENCE_EXECUTOR != "process" and callable(getattr(core, "models_changed", None)):
+        _POLL_TASK = asyncio.get_running_loop().create_task(_poll_weights())
+    if _JOBS is not None:
+        _JOB_WAKEUP = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        _JOB_TASKS.append(loop.create_task(_job_janitor()))
+        _JOB_TASKS.extend(loop.create_task(_job_worker()) for _ in range(JOB_WORKERS))
+
+@app.on_event("shutdown")
+async def _shutdown():
+    if _POLL_TASK is not None:
+        _POLL_TASK.cancel()
+    # a job cut off here stays "running" and is requeued after JOB_STALE_S
+    for task in _JOB_TASKS:
+        task.cancel()
+    if _BATCHER is not None:
+        await _BATCHER.close()
+    _POOL.shutdown()
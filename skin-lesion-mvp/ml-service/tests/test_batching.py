@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_each_caller_gets_its_own_result():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.close()
+        return results
+
+    assert _run(main()) == [0, 10, 20, 30, 40]
+    assert sum(len(c) for c in calls) == 5
+    assert len(calls) < 5  # concurrent submits shared a batch
+
+
+def test_batches_never_exceed_max_batch_size():
+    sizes = []
+
+    def batch_fn(items):
+        sizes.append(len(items))
+        return items
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=3, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        stats = batcher.stats()
+        await batcher.close()
+        return results, stats
+
+    results, stats = _run(main())
+    assert results == list(range(10))
+    assert max(sizes) <= 3
+    assert stats["items"] == 10
+    assert sum(int(k) * v for k, v in stats["batch_size_histogram"].items()) == 10
+
+
+def test_batch_fn_error_reaches_every_caller_of_the_batch():
+    def batch_fn(items):
+        raise ValueError("boom")
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        stats = batcher.stats()
+        await batcher.close()
+        return results, stats
+
+    results, stats = _run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert stats["errors"] >= 1
+
+
+def test_wrong_number_of_results_is_an_error_not_a_misalignment():
+    async def main():
+        batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        await batcher.close()
+        return results
+
+    results = _run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_batcher_keeps_working_after_a_failed_batch():
+    fail = threading.Event()
+    fail.set()
+
+    def batch_fn(items):
+        if fail.is_set():
+            fail.clear()
+            raise ValueError("first batch fails")
+        return items
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=1, max_wait_ms=0)
+        with pytest.raises(ValueError):
+            await batcher.submit("a")
+        result = await batcher.submit("b")
+        await batcher.close()
+        return result
+
+    assert _run(main()) == "b"
+
+
+def test_usable_from_a_new_event_loop():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=2, max_wait_ms=0)
+
+    async def once(x):
+        return await batcher.submit(x)
+
+    # e.g. a TestClient per test: each asyncio.run is a new loop
+    assert _run(once(1)) == 1
+    assert _run(once(2)) == 2
+
+
+def test_batches_run_concurrently_up_to_the_limit():
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def batch_fn(items):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return items
+
+    async def main():
+        pool = ThreadPoolExecutor(max_workers=4)
+        batcher = MicroBatcher(batch_fn, max_batch_size=1, max_wait_ms=0, executor=pool, concurrency=2)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        await batcher.close()
+        pool.shutdown()
+        return results
+
+    assert _run(main()) == list(range(6))
+    assert peak[0] == 2
+
+
+def test_close_waits_for_batches_in_flight():
+    async def main():
+        batcher = MicroBatcher(lambda items: time.sleep(0.05) or items, max_batch_size=1, max_wait_ms=0, concurrency=2)
+        pending = [asyncio.ensure_future(batcher.submit(i)) for i in range(2)]
+        await asyncio.sleep(0.01)  # both batches handed to the executor
+        await batcher.close()
+        return [p.result() for p in pending]
+
+    assert _run(main()) == [0, 1]
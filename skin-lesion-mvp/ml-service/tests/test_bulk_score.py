@@ -0,0 +1,29 @@
+import json
+import os
+
+import pytest
+
+bulk_score = pytest.importorskip("bulk_score")
+
+
+def test_resume_matches_paths_from_any_working_directory(tmp_path, monkeypatch):
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "a.jpg").write_bytes(b"")
+    output = tmp_path / "scores.jsonl"
+    output.write_text(json.dumps({"path": "images/a.jpg", "prediction": {}}) + "\n")
+
+    monkeypatch.chdir(tmp_path)  # the earlier run stored a path relative to here
+    done = bulk_score.already_scored(str(output), "jsonl")
+    monkeypatch.chdir(images)
+    todo = [os.path.abspath(p) for p in bulk_score.iter_inputs(".")]
+    assert todo == [str(images / "a.jpg")]
+    assert set(todo) <= done
+
+
+def test_error_rows_are_retried_unless_disabled(tmp_path):
+    output = tmp_path / "scores.csv"
+    output.write_text("path,class_name,error\n/x/a.jpg,,decode failed\n/x/b.jpg,nv,\n")
+    assert bulk_score.already_scored(str(output), "csv") == {os.path.abspath("/x/b.jpg")}
+    assert bulk_score.already_scored(str(output), "csv", retry_errors=False) == {
+        os.path.abspath("/x/a.jpg"), os.path.abspath("/x/b.jpg")}
@@ -0,0 +1,97 @@
+import cache
+from cache import PredictionCache, image_key
+from PIL import Image
+
+
+def test_hit_after_put_returns_a_fresh_copy():
+    c = PredictionCache()
+    c.put("k", "v1", {"prediction": {"class_name": "nv"}})
+    first = c.get("k", "v1")
+    first["prediction"]["class_name"] = "mutated"
+    assert c.get("k", "v1") == {"prediction": {"class_name": "nv"}}
+    assert c.stats()["hits"] == 2
+
+
+def test_miss_is_counted():
+    c = PredictionCache()
+    assert c.get("missing", "v1") is None
+    assert c.stats()["misses"] == 1
+
+
+def test_version_change_empties_the_cache():
+    c = PredictionCache()
+    c.put("k", "v1", 1)
+    assert c.get("k", "v2") is None
+    stats = c.stats()
+    assert stats["version"] == "v2"
+    assert stats["entries"] == 0
+    assert stats["invalidations"] == 1
+    # and the old version does not come back
+    assert c.get("k", "v1") is None
+
+
+def test_lru_eviction_by_entries():
+    c = PredictionCache(max_entries=2)
+    c.put("a", "v", 1)
+    c.put("b", "v", 2)
+    c.get("a", "v")  # a is now the most recently used
+    c.put("c", "v", 3)
+    assert c.get("b", "v") is None
+    assert c.get("a", "v") == 1
+    assert c.get("c", "v") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_eviction_by_bytes():
+    c = PredictionCache(max_entries=100, max_bytes=20)
+    c.put("a", "v", "x" * 8)  # 10 bytes of JSON
+    c.put("b", "v", "y" * 8)
+    c.put("c", "v", "z" * 8)
+    stats = c.stats()
+    assert stats["bytes"] <= 20
+    assert c.get("a", "v") is None
+    assert c.get("c", "v") == "z" * 8
+
+
+def test_oversized_value_is_not_stored():
+    c = PredictionCache(max_bytes=10)
+    c.put("k", "v", "x" * 100)
+    assert c.stats()["entries"] == 0
+
+
+def test_replacing_a_key_keeps_the_byte_count_exact():
+    c = PredictionCache()
+    c.put("k", "v", "short")
+    c.put("k", "v", "a much longer value")
+    assert c.stats()["entries"] == 1
+    assert c.stats()["bytes"] == len('"a much longer value"')
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    c = PredictionCache(ttl_s=10)
+    c.put("k", "v", 1)
+    now[0] += 5
+    assert c.get("k", "v") == 1
+    now[0] += 6
+    assert c.get("k", "v") is None
+    stats = c.stats()
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+
+
+def test_disabled_cache_stores_nothing():
+    c = PredictionCache(max_entries=0)
+    assert not c.enabled
+    c.put("k", "v", 1)
+    assert c.get("k", "v") is None
+
+
+def test_image_key_depends_on_pixels_only():
+    a = Image.new("RGB", (4, 4), (10, 20, 30))
+    b = Image.new("RGB", (4, 4), (10, 20, 30))
+    c = Image.new("RGB", (4, 4), (10, 20, 31))
+    assert image_key(a) == image_key(b)
+    assert image_key(a) != image_key(c)
+    assert image_key(a) != image_key(Image.new("RGB", (2, 8), (10, 20, 30)))
@@ -0,0 +1,163 @@
+import sqlite3
+
+import pytest
+
+import jobs
+from jobs import JobStore, dedup_key
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(jobs.time, "time", c)
+    return c
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), ttl_s=3600, max_attempts=2)
+
+
+def test_dedup_key():
+    base = dedup_key(b"img", "u1", '{"a": 1}', "v1")
+    assert base == dedup_key(b"img", "u1", '{"a": 1}', "v1")
+    assert base != dedup_key(b"img2", "u1", '{"a": 1}', "v1")
+    assert base != dedup_key(b"img", "u2", '{"a": 1}', "v1")
+    assert base != dedup_key(b"img", "u1", '{"a": 1}', "v2")
+    # an Idempotency-Key replaces the content-derived identity
+    assert dedup_key(b"img", None, None, None, "key-1") == dedup_key(b"other", "u", "m", "v", "key-1")
+
+
+def test_submit_claim_finish(store, clock):
+    job, deduplicated = store.submit(b"img", "k1", user_id="u1", meta="{}", filename="a.jpg")
+    assert not deduplicated
+    assert job["status"] == "queued"
+    assert job["queue_position"] == 0
+
+    claimed = store.claim()
+    assert claimed["id"] == job["id"]
+    assert claimed["payload"] == b"img"
+    assert claimed["attempts"] == 1
+    assert store.claim() is None
+
+    store.finish(job["id"], {"prediction": "nv"})
+    done = store.get(job["id"])
+    assert done["status"] == "done"
+    assert done["result"] == {"prediction": "nv"}
+    assert store.stats() == {"queued": 0, "running": 0, "done": 1, "failed": 0}
+
+
+def test_claims_oldest_first(store, clock):
+    first, _ = store.submit(b"1", "k1")
+    clock.now += 1
+    second, _ = store.submit(b"2", "k2")
+    assert store.get(second["id"])["queue_position"] == 1
+    assert store.claim()["id"] == first["id"]
+    assert store.claim()["id"] == second["id"]
+
+
+def test_same_key_returns_the_existing_job(store, clock):
+    job, _ = store.submit(b"img", "k1")
+    again, deduplicated = store.submit(b"img", "k1")
+    assert deduplicated
+    assert again["id"] == job["id"]
+    assert store.stats()["queued"] == 1
+
+
+def test_failed_and_expired_jobs_are_not_deduplicated(store, clock):
+    job, _ = store.submit(b"img", "k1")
+    store.claim()
+    store.finish(job["id"], error="Invalid image file")
+    retry, deduplicated = store.submit(b"img", "k1")
+    assert not deduplicated and retry["id"] != job["id"]
+
+    store.claim()
+    store.finish(retry["id"], {"ok": True})
+    clock.now += 3601
+    later, deduplicated = store.submit(b"img", "k1")
+    assert not deduplicated and later["id"] != retry["id"]
+
+
+def test_queue_limit(store, clock):
+    assert store.submit(b"1", "k1", max_queued=1)[0] is not None
+    assert store.submit(b"2", "k2", max_queued=1) == (None, False)
+    # a duplicate still resolves to the existing job when the queue is full
+    assert store.submit(b"1", "k1", max_queued=1)[1] is True
+
+
+def test_error_finish_clears_the_payload(store, clock):
+    job, _ = store.submit(b"img", "k1")
+    store.claim()
+    store.finish(job["id"], error="boom")
+    row = store._conn().execute("SELECT payload, result FROM jobs WHERE id = ?", (job["id"],)).fetchone()
+    assert row["payload"] is None and row["result"] is None
+    assert store.get(job["id"])["error"] == "boom"
+
+
+def test_heartbeat_keeps_a_live_job_running(store, clock):
+    job, _ = store.submit(b"img", "k1")
+    store.claim()
+    for _ in range(5):  # e.g. waiting on a saturated pool for much longer than stale_s
+        clock.now += 100
+        assert store.heartbeat(job["id"])
+        assert store.requeue_stale(300) == 0
+    assert store.get(job["id"])["status"] == "running"
+
+
+def test_abandoned_job_is_requeued_then_failed(store, clock):
+    job, _ = store.submit(b"img", "k1")
+    store.claim()
+    clock.now += 301
+    assert store.requeue_stale(300) == 1
+    assert store.get(job["id"])["status"] == "queued"
+
+    assert store.claim()["attempts"] == 2
+    clock.now += 301
+    assert store.requeue_stale(300) == 0  # max_attempts reached
+    failed = store.get(job["id"])
+    assert failed["status"] == "failed"
+    assert "worker crashes" in failed["error"]
+
+
+def test_heartbeat_only_touches_running_jobs(store, clock):
+    job, _ = store.submit(b"img", "k1")
+    assert not store.heartbeat(job["id"])
+    store.claim()
+    store.finish(job["id"], {"ok": True})
+    assert not store.heartbeat(job["id"])
+
+
+def test_purge_removes_old_finished_jobs_only(store, clock):
+    finished, _ = store.submit(b"1", "k1")
+    store.claim()
+    store.finish(finished["id"], {"ok": True})
+    queued, _ = store.submit(b"2", "k2")
+    clock.now += 3601
+    assert store.purge() == 1
+    assert store.get(finished["id"]) is None
+    assert store.get(queued["id"])["status"] == "queued"
+
+
+def test_opening_a_database_without_heartbeats_adds_the_column(tmp_path, clock):
+    path = str(tmp_path / "old.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.executescript(jobs._SCHEMA.replace("heartbeat_at REAL,", ""))
+    conn.execute(
+        "INSERT INTO jobs (id, dedup_key, status, created_at, started_at, attempts) VALUES ('j', 'k', 'running', ?, ?, 1)",
+        (clock.now, clock.now),
+    )
+    conn.commit()
+    conn.close()
+
+    store = JobStore(path, max_attempts=3)
+    clock.now += 301
+    assert store.requeue_stale(300) == 1  # falls back to started_at
+    assert store.get("j")["status"] == "queued"
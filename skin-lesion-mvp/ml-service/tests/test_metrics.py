@@ -0,0 +1,50 @@
+from metrics import Registry, render_stats
+
+
+def test_counter_renders_sorted_labelled_series():
+    reg = Registry()
+    requests = reg.counter("requests_total", "Requests")
+    requests.inc(endpoint="/predict", outcome="ok")
+    requests.inc(endpoint="/predict", outcome="ok")
+    requests.inc(outcome="busy", endpoint="/predict")  # label order does not matter
+    lines = reg.render().splitlines()
+    assert lines[:2] == ["# HELP requests_total Requests", "# TYPE requests_total counter"]
+    assert 'requests_total{endpoint="/predict",outcome="busy"} 1.0' in lines
+    assert 'requests_total{endpoint="/predict",outcome="ok"} 2.0' in lines
+
+
+def test_label_values_are_escaped():
+    reg = Registry()
+    reg.gauge("g", "G").set(1, path='a"b\\c\nd')
+    assert 'g{path="a\\"b\\\\c\\nd"} 1.0' in reg.render().splitlines()
+
+
+def test_unlabelled_gauge_overwrites():
+    reg = Registry()
+    g = reg.gauge("ready", "Ready")
+    g.set(0)
+    g.set(1)
+    assert "ready 1.0" in reg.render().splitlines()
+
+
+def test_histogram_buckets_are_cumulative():
+    reg = Registry()
+    h = reg.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        h.observe(value, stage="forward")
+    lines = reg.render().splitlines()
+    assert 'latency_seconds_bucket{stage="forward",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="forward",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{stage="forward",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{stage="forward"} 6.05' in lines
+    assert 'latency_seconds_count{stage="forward"} 4' in lines
+
+
+def test_render_stats_keeps_numbers_only():
+    text = render_stats("pool", {"kind": "thread", "pending": 3, "avg_ms": 1.5, "enabled": True, "hist": {"1": 2}})
+    assert text.splitlines() == [
+        "# TYPE pool_pending gauge", "pool_pending 3",
+        "# TYPE pool_avg_ms gauge", "pool_avg_ms 1.5",
+        "# TYPE pool_enabled gauge", "pool_enabled 1",
+    ]
+    assert render_stats("empty", {"kind": "x"}) == ""
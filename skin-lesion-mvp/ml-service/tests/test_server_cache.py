@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+os.environ.setdefault("JOB_WORKERS", "0")  # no job database for these tests
+server = pytest.importorskip("server")
+
+
+@pytest.fixture
+def process_mode(monkeypatch):
+    monkeypatch.setattr(server, "INFERENCE_EXECUTOR", "process")
+    monkeypatch.setattr(server, "_WORKER_MODEL_VERSION", {"version": None})
+
+
+def test_process_mode_learns_the_version_from_results(process_mode):
+    # the models live in the worker processes; this process has no registry of its own
+    assert server._model_version() is None
+    assert server._result_version({"model_version": "abc123"}) == "abc123"
+    assert server._model_version() == "abc123"
+
+
+def test_process_mode_cache_serves_hits(process_mode, monkeypatch):
+    cache = server.PredictionCache()
+    monkeypatch.setattr(server, "_CACHE", cache)
+    raw = {"model_version": "abc123", "prediction": {"class_name": "nv"}}
+    cache.put("key", server._result_version(raw), server._cacheable(raw))
+    # the lookup in _infer uses _model_version(); it must match what put() stored
+    assert cache.get("key", server._model_version()) == raw
+    assert cache.stats()["hits"] == 1
+
+
+def test_thread_mode_asks_the_registry(monkeypatch):
+    monkeypatch.setattr(server, "INFERENCE_EXECUTOR", "thread")
+    monkeypatch.setattr(server.core, "model_version", lambda: "from-registry")
+    assert server._model_version() == "from-registry"
+    assert server._result_version({}) == "from-registry"
+
+
+def test_cached_copy_reports_no_tta_pass():
+    raw = {"model_version": "v", "tta": {"applied": True, "views": 5, "pass_ms": 42.0}, "timings": {"tta": 0.042}}
+    cached = server._cacheable(raw)
+    assert cached["tta"] == {"applied": True, "views": 5, "pass_ms": 0.0}
+    assert "timings" not in cached
+    assert raw["tta"]["pass_ms"] == 42.0  # the live response keeps its own timing
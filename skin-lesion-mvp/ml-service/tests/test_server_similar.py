@@ -0,0 +1,85 @@
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("JOB_WORKERS", "0")  # no job database for these tests
+server = pytest.importorskip("server")
+torch = pytest.importorskip("torch")
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from registry import ModelSet  # noqa: E402
+
+
+class TinyNet(torch.nn.Module):
+    """Stands in for a backbone: named "resnet50", so classifier_head finds .fc"""
+
+    def __init__(self):
+        super().__init__()
+        self.pool = torch.nn.AdaptiveAvgPool2d(1)
+        self.fc = torch.nn.Linear(3, 7)
+
+    def forward(self, x):
+        return self.fc(torch.flatten(self.pool(x), 1))
+
+
+class OrtLike:
+    """Callable, but not an nn.Module, like onnx_backend.OrtBackbone"""
+
+    def __init__(self, module):
+        self.module_ = module
+
+    def __call__(self, x):
+        return self.module_(x)
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    vectors = np.eye(2, 3, dtype=np.float16)
+    vectors.tofile(tmp_path / "vectors.f16")
+    manifest = {"backbones": {"resnet50": [0, 3]}, "dim": 3,
+                "rows": [{"id": "a", "label": "nv", "label_source": "metadata"},
+                         {"id": "b", "label": "mel", "label_source": "metadata"}]}
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    return str(tmp_path)
+
+
+def _post_similar(monkeypatch, index_dir, models, fused=None):
+    model_set = ModelSet(models, torch.device("cpu"), "test", fused=fused)
+    monkeypatch.setattr(server.core, "_active_models", lambda: model_set)
+    monkeypatch.setattr(server.core, "_CASCADE", None)
+    monkeypatch.setattr(server.core, "_TTA", None)
+    monkeypatch.setattr(server, "SIMILAR_INDEX_DIR", index_dir)
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), (200, 120, 90)).save(buf, format="PNG")
+    return TestClient(server.app).post("/similar?k=1", files={"file": ("a.png", buf.getvalue(), "image/png")})
+
+
+def test_hooked_backbone_returns_neighbours(monkeypatch, index_dir):
+    models = {"resnet50": TinyNet().eval()}
+    server.core.attach_embedding_hooks(models)
+    r = _post_similar(monkeypatch, index_dir, models)
+    assert r.status_code == 200, r.text
+    assert r.json()["similar"]["backbones"] == ["resnet50"]
+    assert len(r.json()["similar"]["results"]) == 1
+
+
+def test_onnx_backbones_answer_409(monkeypatch, index_dir):
+    r = _post_similar(monkeypatch, index_dir, {"resnet50": OrtLike(TinyNet().eval())})
+    assert r.status_code == 409, r.text
+
+
+def test_torchscript_backbones_answer_409(monkeypatch, index_dir):
+    r = _post_similar(monkeypatch, index_dir, {"resnet50": torch.jit.script(TinyNet().eval())})
+    assert r.status_code == 409, r.text
+
+
+def test_scripted_fused_ensemble_answers_409(monkeypatch, index_dir):
+    models = {"resnet50": TinyNet().eval()}
+    fused = server.core.fuse_models(models, torch.device("cpu"), script=True)
+    assert isinstance(fused, torch.jit.ScriptModule)
+    r = _post_similar(monkeypatch, index_dir, models, fused=fused)
+    assert r.status_code == 409, r.text
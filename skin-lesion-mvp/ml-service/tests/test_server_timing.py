@@ -0,0 +1,40 @@
+import os
+import time
+
+import pytest
+
+os.environ.setdefault("JOB_WORKERS", "0")  # no job database for these tests
+server = pytest.importorskip("server")
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+def _stages(header):
+    return {part.split(";dur=")[0]: float(part.split(";dur=")[1]) for part in header.split(", ")}
+
+
+def test_upload_stage_is_reported_and_counted_in_total(monkeypatch):
+    async def fake_predict(file, userId, meta, stages):
+        stages["inference"] = 0.0
+        return {"ok": True}
+
+    monkeypatch.setattr(server, "_predict", fake_predict)
+    r = TestClient(server.app).post("/predict?timing=1", files={"file": ("a.png", b"x" * 1024, "image/png")})
+    assert r.status_code == 200, r.text
+    stages = _stages(r.headers["Server-Timing"])
+    assert list(stages)[0] == "upload"
+    assert stages["total"] >= stages["upload"]
+
+
+def test_track_counts_total_from_receipt():
+    stages = {}
+    with server._track("/predict", stages, time.perf_counter() - 0.5):
+        pass
+    assert stages["upload"] >= 0.5
+    assert stages["total"] >= stages["upload"]
+
+
+def test_track_without_receipt_time_has_no_upload_stage():
+    stages = {}
+    with server._track("/predict", stages):
+        pass
+    assert "upload" not in stages and "total" in stages
@@ -0,0 +1,65 @@
+# uploads.py
+"""
+Request-body size limits enforced while the upload streams in.
+
+The multipart parser spools file parts to a temp file as they arrive but
+never looks at their size. This ASGI middleware rejects a request
+whose Content-Length is over the limit for its path before reading any body,
+and counts bytes as they are received for chunked / unannounced bodies, so an
+oversized upload is cut off with 413 instead of being received in full.
+
+It also stamps each request's arrival time (`request.state.received_at`, a
+perf_counter value) so handlers can report the upload stage.
+"""
+import time
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# room for the multipart boundaries, part headers and small form fields (userId, meta)
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _too_large(limit: int) -> str:
+    return f"Upload too large (max {limit} bytes)"
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = dict(limits)  # path -> max upload bytes (multipart overhead is allowed on top)
+
+    def _limit(self, scope) -> Optional[int]:
+        if scope["type"] != "http" or scope.get("method") not in ("POST", "PUT"):
+            return None
+        return self.limits.get(scope["path"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        limit = self._limit(scope)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        max_body = limit + MULTIPART_OVERHEAD
+
+        declared = dict(scope.get("headers") or []).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > max_body:
+            response = JSONResponse(status_code=413, content={"detail": _too_large(limit)}, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    # raised inside form parsing; FastAPI re-raises HTTPExceptions from there as-is
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
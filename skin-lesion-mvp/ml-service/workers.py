@@ -0,0 +1,91 @@
+# workers.py
+"""
+Bounded inference pool used by server.py.
+
+CPU-bound work (model forward passes) is dispatched to a thread or process
+pool so the asyncio event loop stays free for /health and request parsing.
+Admission is bounded: once `max_pending` requests are in flight, new ones are
+rejected with `Saturated` so the caller can answer 503 + Retry-After instead
+of queueing without limit.
+"""
+import asyncio
+import functools
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class Saturated(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    def __init__(
+        self,
+        kind: str = "thread",
+        workers: int = 2,
+        max_pending: int = 32,
+        initializer: Optional[Callable[[], Any]] = None,
+    ):
+        self.kind = kind
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=initializer)
+        elif kind == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        else:
+            raise ValueError(f"Unknown executor kind: {kind!r} (expected 'thread' or 'process')")
+
+        self._pending = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._avg_latency = 0.0  # EWMA of admitted request latency, seconds
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, estimated from recent latency."""
+        est = self._avg_latency * self._pending / self.workers
+        return max(1, math.ceil(est))
+
+    def has_capacity(self) -> bool:
+        """True if admit() would succeed right now."""
+        return self._pending < self.max_pending
+
+    @contextmanager
+    def admit(self):
+        """Reserve an in-flight slot or raise Saturated (call from the event loop only)."""
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise Saturated(self.retry_after())
+        self._pending += 1
+        self._admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._pending -= 1
+            elapsed = time.perf_counter() - started
+            self._avg_latency = elapsed if self._avg_latency == 0.0 else 0.9 * self._avg_latency + 0.1 * elapsed
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "avg_latency_ms": 1000.0 * self._avg_latency,
+        }